@@ -0,0 +1,29 @@
+import argparse
+import pygame
+
+from scripts.atlas import build_atlas
+from scripts.utils import BASE_IMAGE_PATH, ATLAS_PATH
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Pack the images in sheets, the game and editor load them "
+        + "from the sheets when they exist"
+    )
+    parser.add_argument(
+        "-o", "--output", default=ATLAS_PATH, help="output folder for the sheets"
+    )
+    parser.add_argument(
+        "--sheet-size", type=int, default=512, help="width and height of each sheet"
+    )
+    args = parser.parse_args()
+
+    # images are converted to the display format like in the game
+    pygame.init()
+    pygame.display.set_mode((1, 1), pygame.HIDDEN)
+    manifest = build_atlas(BASE_IMAGE_PATH, args.output, args.sheet_size)
+    print(len(manifest["images"]), "images in", len(manifest["sheets"]), "sheets")
+
+
+if __name__ == "__main__":
+    main()
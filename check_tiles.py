@@ -0,0 +1,115 @@
+import argparse
+import glob
+import sys
+import pygame
+
+from scripts.assets import AssetManager, EDITOR_ASSETS
+from scripts.tilemap import Tilemap, CHUNK_SIZE
+
+# tile groups that can be placed on the grid in the editor
+GRID_GROUPS = ["decor", "grass", "large_decor", "stone"]
+
+
+class Assets:
+    # the part of the game or the editor that Tilemap uses
+    def __init__(self):
+        self.assets = AssetManager().load(EDITOR_ASSETS)
+
+
+def render_tiles(tilemap: Tilemap, surf: pygame.Surface, offset):
+    # tile by tile without the baked chunks, what render must draw
+    for tile in tilemap.offgrid_tiles:
+        surf.blit(
+            tilemap.game.assets[tile["type"]][tile["variant"]],
+            (int(tile["pos"][0]) - offset[0], int(tile["pos"][1]) - offset[1]),
+        )
+    for x, y, tile_type, variant in sorted(
+        tilemap.tiles(), key=lambda tile: (tile[1], tile[0])
+    ):
+        surf.blit(
+            tilemap.game.assets[tile_type][variant],
+            (x * tilemap.tile_size - offset[0], y * tilemap.tile_size - offset[1]),
+        )
+
+
+def matches(tilemap: Tilemap, area: pygame.Rect):
+    """
+    :return: True if render and render_mask draw the same as render_tiles in area
+    """
+    baked = pygame.Surface(area.size, pygame.SRCALPHA)
+    tilemap.render(baked, area.topleft)
+    expected = pygame.Surface(area.size, pygame.SRCALPHA)
+    render_tiles(tilemap, expected, area.topleft)
+    mask = pygame.mask.Mask(area.size)
+    tilemap.render_mask(mask, area.topleft)
+    expected_mask = pygame.mask.from_surface(expected)
+    return (
+        pygame.image.tobytes(baked, "RGBA") == pygame.image.tobytes(expected, "RGBA")
+        and mask.count() == expected_mask.count()
+        and mask.overlap_area(expected_mask, (0, 0)) == expected_mask.count()
+    )
+
+
+def check_map(game, path):
+    tilemap = Tilemap(game)
+    tilemap.load(path)
+    cells = [(x, y) for x, y, tile_type, variant in tilemap.tiles()]
+    if not cells:
+        return True
+    area = pygame.Rect(
+        min(x for x, y in cells) * tilemap.tile_size,
+        min(y for x, y in cells) * tilemap.tile_size,
+        (max(x for x, y in cells) - min(x for x, y in cells) + 1) * tilemap.tile_size,
+        (max(y for x, y in cells) - min(y for x, y in cells) + 1) * tilemap.tile_size,
+    ).inflate(128, 128)
+    return matches(tilemap, area)
+
+
+def check_edges(game, tile_type, variant):
+    # the tile on the last cells of a chunk, drawn in the chunks around too
+    tilemap = Tilemap(game)
+    chunk_px = CHUNK_SIZE * tilemap.tile_size
+    area = pygame.Rect(-chunk_px, -chunk_px, chunk_px * 3, chunk_px * 3)
+    last = CHUNK_SIZE - 1
+    tilemap.set_tile(last, 3, tile_type, variant)
+    tilemap.set_tile(2, last, tile_type, variant)
+    ok = matches(tilemap, area)
+    # edits after the chunks were baked
+    tilemap.set_tile(last, last, tile_type, variant)
+    tilemap.set_tile(last + 1, last, "stone", 0)
+    ok = ok and matches(tilemap, area)
+    tilemap.remove_tile(last, 3)
+    tilemap.remove_tile(last, last)
+    return ok and matches(tilemap, area)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check that the baked chunks draw the same as drawing "
+        + "the tiles one by one, also for big tiles at the chunk borders"
+    )
+    parser.add_argument(
+        "maps", nargs="*", help="maps to check, defaults to data/maps/*.json"
+    )
+    args = parser.parse_args()
+
+    pygame.init()
+    pygame.display.set_mode((1, 1), pygame.HIDDEN)
+    game = Assets()
+
+    failed = 0
+    for path in args.maps or sorted(glob.glob("data/maps/*.json")):
+        ok = check_map(game, path)
+        failed += not ok
+        print(path, "ok" if ok else "MISMATCH")
+    for tile_type in GRID_GROUPS:
+        for variant in range(len(game.assets[tile_type])):
+            if not check_edges(game, tile_type, variant):
+                failed += 1
+                print(tile_type, variant, "at the chunk borders MISMATCH")
+    print("all ok" if not failed else str(failed) + " mismatches")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
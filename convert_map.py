@@ -0,0 +1,53 @@
+import argparse
+import os
+
+from scripts import mapformat
+from scripts.tilemap import Tilemap
+from scripts.streaming import split_world
+
+
+def convert(src, dst):
+    # loading and saving don't need the game assets
+    tilemap = Tilemap(None)
+    tilemap.load(src)
+    tilemap.save(dst)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert maps between JSON and the binary "
+        + mapformat.EXTENSION
+        + " format"
+    )
+    parser.add_argument("maps", nargs="+", help=".json or .tmap map files")
+    parser.add_argument(
+        "-o", "--output", help="output folder, defaults to the folder of each map"
+    )
+    parser.add_argument(
+        "--world",
+        help="split the maps in chunk files for streaming, "
+        + "one folder per map inside this folder (e.g. data/worlds)",
+    )
+    args = parser.parse_args()
+
+    if args.world:
+        for src in args.maps:
+            tilemap = Tilemap(None)
+            tilemap.load(src)
+            dst = os.path.join(args.world, os.path.splitext(os.path.basename(src))[0])
+            split_world(tilemap, dst)
+            print(src, "->", dst, len(os.listdir(dst)) - 1, "chunks")
+        return
+
+    for src in args.maps:
+        stem, ext = os.path.splitext(src)
+        dst = stem + (".json" if ext == mapformat.EXTENSION else mapformat.EXTENSION)
+        if args.output:
+            os.makedirs(args.output, exist_ok=True)
+            dst = os.path.join(args.output, os.path.basename(dst))
+        convert(src, dst)
+        print(src, "->", dst, os.path.getsize(src), "->", os.path.getsize(dst), "bytes")
+
+
+if __name__ == "__main__":
+    main()
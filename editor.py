@@ -1,32 +1,27 @@
 import sys
 import pygame
 
-from scripts.utils import load_images
-from scripts.tilemap import Tilemap
-
-RENDER_SCALE = 2.0
+from scripts.assets import AssetManager, EDITOR_ASSETS
+from scripts.tilemap import Tilemap, AUTOTILE_TYPES
+from scripts.presenter import Presenter
 
 
 class Editor:
     def __init__(self):
         pygame.init()
-        pygame.display.set_caption("editor")
 
-        self.screen = pygame.display.set_mode((640, 480))
         # the game will draw in half resolution and then scaled up
         # to give more impression of a pixel art game
+        self.presenter = Presenter((320, 240), (640, 480), "editor")
         self.display = pygame.Surface((320, 240))
         self.clock = pygame.time.Clock()
 
         self.movement = [False, False, False, False]
 
-        self.assets = {
-            "decor": load_images("tiles/decor"),
-            "grass": load_images("tiles/grass"),
-            "large_decor": load_images("tiles/large_decor"),
-            "stone": load_images("tiles/stone"),
-            "spawners": load_images("tiles/spawners"),
-        }
+        # same manifest as the game, see scripts/assets.py
+        asset_manager = AssetManager()
+        asset_manager.use_atlas()
+        self.assets = asset_manager.load(EDITOR_ASSETS)
 
         self.tile_list = list(self.assets)
         self.tile_group = 0
@@ -65,8 +60,7 @@ class Editor:
             ][self.tile_variant].copy()
             current_tile_img.set_alpha(100)
 
-            mpos = pygame.mouse.get_pos()
-            mpos = mpos[0] / RENDER_SCALE, mpos[1] / RENDER_SCALE
+            mpos = self.presenter.window_to_source(pygame.mouse.get_pos())
             tile_pos = (
                 int(mpos[0] + self.scroll[0]) // self.tilemap.tile_size,
                 int(mpos[1] + self.scroll[1]) // self.tilemap.tile_size,
@@ -90,29 +84,27 @@ class Editor:
 
             # place current selected tile ongrid
             if self.clicking and self.ongrid:
-                self.tilemap.tilemap[str(tile_pos[0]) + ";" + str(tile_pos[1])] = {
-                    "type": self.tile_list[self.tile_group],
-                    "variant": self.tile_variant,
-                    "pos": tile_pos,
-                }
+                tile_type = self.tile_list[self.tile_group]
+                current = self.tilemap.get_tile(tile_pos[0], tile_pos[1])
+                # autotiled tiles choose their own variant, don't fight it while dragging
+                if (
+                    current is None
+                    or current[0] != tile_type
+                    or tile_type not in AUTOTILE_TYPES
+                ):
+                    self.tilemap.set_tile(
+                        tile_pos[0], tile_pos[1], tile_type, self.tile_variant
+                    )
+                    self.tilemap.autotile_around(tile_pos[0], tile_pos[1])
             # delete tiles
             if self.right_clicking:
-                tile_loc = str(tile_pos[0]) + ";" + str(tile_pos[1])
-                if tile_loc in self.tilemap.tilemap:
-                    del self.tilemap.tilemap[tile_loc]
-                # delete tiles offgrid (not worried about performance)
-                for tile in self.tilemap.offgrid_tiles.copy():
-                    tile_img: pygame.Surface = self.assets[tile["type"]][
-                        tile["variant"]
-                    ]
-                    tile_rect = pygame.Rect(
-                        tile["pos"][0] - self.scroll[0],
-                        tile["pos"][1] - self.scroll[1],
-                        tile_img.get_width(),
-                        tile_img.get_height(),
-                    )
-                    if tile_rect.collidepoint(mpos):
-                        self.tilemap.offgrid_tiles.remove(tile)
+                if self.tilemap.remove_tile(tile_pos[0], tile_pos[1]):
+                    self.tilemap.autotile_around(tile_pos[0], tile_pos[1])
+                # delete tiles offgrid
+                for tile in self.tilemap.offgrid_at(
+                    (mpos[0] + self.scroll[0], mpos[1] + self.scroll[1])
+                ):
+                    self.tilemap.remove_offgrid(tile)
 
             # show current select tile on top left
             self.display.blit(current_tile_img, (5, 5))
@@ -121,21 +113,17 @@ class Editor:
                 if event.type == pygame.QUIT:
                     pygame.quit()
                     sys.exit()
+                self.presenter.handle_event(event)
 
                 if event.type == pygame.MOUSEBUTTONDOWN:
                     if event.button == 1:
                         self.clicking = True
                         # place tiles offgrid
                         if not self.ongrid:
-                            self.tilemap.offgrid_tiles.append(
-                                {
-                                    "type": self.tile_list[self.tile_group],
-                                    "variant": self.tile_variant,
-                                    "pos": (
-                                        mpos[0] + self.scroll[0],
-                                        mpos[1] + self.scroll[1],
-                                    ),
-                                }
+                            self.tilemap.add_offgrid(
+                                self.tile_list[self.tile_group],
+                                self.tile_variant,
+                                (mpos[0] + self.scroll[0], mpos[1] + self.scroll[1]),
                             )
                     if event.button == 3:
                         self.right_clicking = True
@@ -200,10 +188,7 @@ class Editor:
                     if event.key == pygame.K_LCTRL:
                         self.ctrl = False
 
-            self.screen.blit(
-                pygame.transform.scale(self.display, self.screen.get_size()), (0, 0)
-            )
-            pygame.display.update()
+            self.presenter.present(self.display)
             self.clock.tick(60)
 
 
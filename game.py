@@ -1,5 +1,7 @@
 import os
 import sys
+import time
+import argparse
 import pygame
 import random
 import math
@@ -7,313 +9,492 @@ import math
 from typing import Union
 
 from scripts.entities import Player, Enemy
-from scripts.utils import load_image, load_images, Animation
+from scripts.utils import flip_image, NullSound
+from scripts.assets import AssetManager, GAME_ASSETS, GAME_SOUNDS
 from scripts.tilemap import Tilemap
 from scripts.clouds import Clouds
-from scripts.particle import Particle
-from scripts.spark import Spark
+from scripts.particle import ParticleSystem
+from scripts.spark import SparkSystem
+from scripts.projectile import ProjectileSystem
+from scripts.physics import BatchPhysics
+from scripts.spatial import SpatialHash
+from scripts.activity import ActivityRegions
+from scripts.emitter import Emitters
+from scripts import mapformat
+from scripts.streaming import ChunkStreamer, MANIFEST
+from scripts.inputs import KeyboardInput, ScriptedInput
+from scripts.transition import TRANSITIONS
+from scripts.presenter import Presenter, BACKENDS
+
+# below this many enemies updating all of them is cheaper than finding
+# the far ones, the level of detail is off
+LOD_MIN_ENEMIES = 8
+
+# the simulation always advances in ticks of 1 / TICK_RATE seconds
+TICK_RATE = 60
+TICK = 1 / TICK_RATE
+# drawing is capped at this rate, it is between two ticks
+MAX_FPS = 60
+# when even skipping frames can't keep up, the game slows down
+MAX_TICKS_PER_FRAME = 5
 
 
 class Game:
-    def __init__(self):
+    def __init__(
+        self,
+        headless=False,
+        seed=None,
+        input_source=None,
+        transition="iris",
+        scaler="scale",
+        integer_scale=False,
+        lod=True,
+        time_scale=1.0,
+    ):
+        """
+        :param headless: no window and no sound, the simulation runs uncapped
+        :param seed: seed for the random numbers, same seed and inputs replay
+            the same game
+        :param input_source: where key presses come from, the keyboard by default
+        :param transition: effect between levels, a key of TRANSITIONS
+        :param scaler: how the display is scaled to the window, see Presenter
+        :param integer_scale: only scale the display by whole numbers
+        :param lod: enemies far from the view update less often or sleep,
+            when the level has at least LOD_MIN_ENEMIES
+        :param time_scale: speed of the game, 2 is fast forward, only with a window
+            (headless runs step as fast as they can)
+        """
+        if time_scale <= 0:
+            raise ValueError("time_scale must be positive")
+        self.headless = headless
+        if headless:
+            os.environ["SDL_VIDEODRIVER"] = "dummy"
+            os.environ["SDL_AUDIODRIVER"] = "dummy"
+        if seed is not None:
+            random.seed(seed)
+        # screenshake only changes the picture, it has its own random numbers
+        # so the game plays the same with or without rendering
+        self.render_random = random.Random(seed)
+        self.input_source = input_source or KeyboardInput()
+        # frame counts the simulation ticks
+        self.frame = 0
+        self.time_scale = time_scale
+
         pygame.init()
-        pygame.display.set_caption("Ninja Game")
 
-        self.screen = pygame.display.set_mode((640, 480))
         # the game will draw in half resolution and then scaled up
         # to give more impression of a pixel art game
+        self.presenter = Presenter(
+            (320, 240), (640, 480), "Ninja Game", scaler, integer_scale
+        )
+        # the presenter owns the window
         self.display = pygame.Surface((320, 240), pygame.SRCALPHA)
         self.display_2 = pygame.Surface((320, 240))
         self.clock = pygame.time.Clock()
 
         self.movement = [False, False]
 
-        self.assets = {
-            "player": load_image("entities/player.png"),
-            "decor": load_images("tiles/decor"),
-            "grass": load_images("tiles/grass"),
-            "large_decor": load_images("tiles/large_decor"),
-            "stone": load_images("tiles/stone"),
-            "background": load_image("background.png"),
-            "gun": load_image("gun.png"),
-            "projectile": load_image("projectile.png"),
-            "clouds": load_images("clouds"),
-            "player/idle": Animation(load_images("entities/player/idle"), 6),
-            "player/jump": Animation(load_images("entities/player/jump")),
-            "player/run": Animation(load_images("entities/player/run"), 4),
-            "player/slide": Animation(load_images("entities/player/slide")),
-            "player/wall_slide": Animation(load_images("entities/player/wall_slide")),
-            "enemy/idle": Animation(load_images("entities/enemy/idle"), 6),
-            "enemy/run": Animation(load_images("entities/enemy/run"), 4),
-            # at the end of the animation loop, stop looping. Particles are marked for
-            # deleting at the end of Animation
-            "particle/leaf": Animation(load_images("particles/leaf"), 20, False),
-            "particle/particle": Animation(load_images("particles/particle"), 6, False),
-        }
-
+        # images and sounds are decoded in parallel, see scripts/assets.py
+        self.asset_manager = AssetManager()
+        self.asset_manager.use_atlas()
+        self.asset_manager.add_lazy(
+            "font", lambda: pygame.font.SysFont("comicsans", 30)
+        )
+        self.assets = self.asset_manager.load(
+            GAME_ASSETS + ([] if headless else GAME_SOUNDS)
+        )
+        # enemies looking left hold the gun mirrored
+        self.assets["gun/flipped"] = flip_image(self.assets["gun"])
+
+        # sounds are "sfx/<name>" in the manifest
         self.sfx = {
-            "jump": pygame.mixer.Sound("data/sfx/jump.wav"),
-            "dash": pygame.mixer.Sound("data/sfx/dash.wav"),
-            "hit": pygame.mixer.Sound("data/sfx/hit.wav"),
-            "shoot": pygame.mixer.Sound("data/sfx/shoot.wav"),
-            "ambience": pygame.mixer.Sound("data/sfx/ambience.wav"),
+            name.split("/")[1]: (NullSound() if headless else self.assets.pop(name))
+            for name in GAME_SOUNDS
         }
 
-        self.sfx["jump"].set_volume(0.7)
-        self.sfx["dash"].set_volume(0.3)
-        self.sfx["hit"].set_volume(0.8)
-        self.sfx["shoot"].set_volume(0.4)
-        self.sfx["ambience"].set_volume(0.2)
-
         self.player = Player(self, (50, 50), (8, 15))
         self.dead = 0
 
         self.tilemap = Tilemap(self)
+        # only used by levels split in chunk files (data/worlds/<level>)
+        self.streamer: Union[ChunkStreamer, None] = None
 
         # camera
         self.scroll = [0.0, 0.0]
+        # before the last tick, to draw between ticks
+        self.last_scroll = [0.0, 0.0]
         self.screenshake = 0
 
         self.clouds = Clouds(self.assets["clouds"], 1)
 
-        self.leaf_spawners = []
         self.enemies = []
-        self.particles: list[Particle] = []
-        self.sparks: list[Spark] = []
-        # [[x, y], direction, timer]
-        self.projectiles: list[list[Union[tuple[float, float], float]]] = []
+        # moves the enemies together, a level can have many of them
+        self.physics = BatchPhysics()
+        # the player and the enemies, to find what touches what
+        self.spatial = SpatialHash()
+        self.activity = ActivityRegions() if lod else None
+        # leaves sway left/right while falling
+        # the caps drop the oldest effects when a fight gets too busy
+        self.particles = ParticleSystem(
+            self, ["leaf", "particle"], sway={"leaf": (0.035, 0.3)}, max_count=2048
+        )
+        self.sparks = SparkSystem(max_count=1024)
+        # trees drop leaves moving down and a little left, larger trees drop more
+        # leaves start in a random frame variant
+        self.leaf_emitters = Emitters(
+            self.particles,
+            "leaf",
+            49999,
+            velocity=(-0.1, 0.3),
+            max_start_frame=20,
+            rng=random.Random(seed),
+        )
+        # no cap, a bullet still flying is never dropped
+        self.projectiles = ProjectileSystem()
 
         self.level = 0
         # transition < 0 - black to clear
         # transition > 0 - clear to black
         self.transition = 0
+        self.transition_effect = TRANSITIONS[transition](self.display.get_size())
         self.load_level(self.level)
 
-        self.font = pygame.font.SysFont("comicsans", 30)
-
-    def run(self):
-        pygame.mixer.music.load("data/music.wav")
-        pygame.mixer.music.set_volume(0.5)
-        pygame.mixer.music.play(-1)
+    @property
+    def font(self):
+        # only the debug text uses it, looking up system fonts is slow
+        return self.asset_manager.get_lazy("font")
+
+    def run(self, frames=None, render=True):
+        """
+        Runs the game loop, forever or for a number of frames (simulation ticks).
+        With a window the ticks follow the clock whatever the frame rate is,
+        and each frame is drawn between the last two ticks.
+        Headless runs do one tick per frame, uncapped
+        :param render: draw the frames, headless runs can skip it to only simulate
+        """
+        if not self.headless:
+            pygame.mixer.music.load("data/music.wav")
+            pygame.mixer.music.set_volume(0.5)
+            pygame.mixer.music.play(-1)
         self.sfx["ambience"].play(-1)
 
-        while True:
-            # clear screen
-            self.display.fill((0, 0, 0, 0))
-            self.display_2.blit(self.assets["background"], (0, 0))
-
-            self.screenshake = max(0, self.screenshake - 1)
-
-            if not len(self.enemies):
-                self.transition += 1
-                # load new level when it is complete black
-                if self.transition > 30:
-                    self.level = (self.level + 1) % len(os.listdir("data/maps"))
-                    self.load_level(self.level)
-            if self.transition < 0:
-                self.transition += 1
-
-            # gives 40 frames to player disapear before reload level
-            if self.dead:
-                self.dead += 1
-                if self.dead >= 10:
-                    self.transition = min(self.transition + 1, 30)
-                if self.dead > 40:
-                    self.load_level(self.level)
-
-            # update camera to follow player with delay
-            self.scroll[0] += (
-                self.player.rect().centerx
-                - self.display.get_width() / 2
-                - self.scroll[0]
-            ) / 30
-            self.scroll[1] += (
-                self.player.rect().centery
-                - self.display.get_height() / 2
-                - self.scroll[1]
-            ) / 30
-            render_scroll = int(self.scroll[0]), int(self.scroll[1])
-
-            for rect in self.leaf_spawners:
-                # probability of spawning
-                # larger spawners will spawn more
-                if random.random() * 49999 < rect.width * rect.height:
-                    pos = (
-                        rect.x + random.random() * rect.width,
-                        rect.y + random.random() * rect.height,
-                    )
-                    # spawn a leaf moving down and a little left
-                    # starts in a random frame variant
-                    self.particles.append(
-                        Particle(
-                            self,
-                            "leaf",
-                            pos,
-                            velocity=[-0.1, 0.3],
-                            frame=random.randint(0, 20),
-                        )
-                    )
-
-            self.clouds.update()
-            self.clouds.render(self.display_2, render_scroll)
-
-            self.tilemap.render(self.display, offset=render_scroll)
-
-            for enemy in self.enemies.copy():
-                kill = enemy.update(self.tilemap, (0, 0))
-                enemy.render(self.display, render_scroll)
-                if kill:
-                    self.enemies.remove(enemy)
-
-            if not self.dead:
-                self.player.update(
-                    self.tilemap, (self.movement[1] - self.movement[0], 0)
+        start = time.perf_counter()
+        end_frame = None if frames is None else self.frame + frames
+        # game time not simulated yet, in seconds
+        accumulator = 0.0
+        last_time = start
+        # key presses read since the last tick
+        pending = []
+        while end_frame is None or self.frame < end_frame:
+            if self.headless:
+                self.step()
+                if render:
+                    self.render()
+                # uncapped, tick() only measures
+                self.clock.tick()
+                continue
+
+            # the window is served every frame, even when no tick runs
+            pending += self.handle_window(self.input_source.events(self.frame))
+            now = time.perf_counter()
+            # a long stall (e.g. dragging the window) doesn't fast forward
+            accumulator += min(now - last_time, 0.25) * self.time_scale
+            last_time = now
+            max_ticks = MAX_TICKS_PER_FRAME * max(1, math.ceil(self.time_scale))
+            ticks = 0
+            while accumulator >= TICK and ticks < max_ticks:
+                if end_frame is not None and self.frame >= end_frame:
+                    break
+                self.step(pending)
+                pending = []
+                accumulator -= TICK
+                ticks += 1
+            if ticks == max_ticks:
+                # too slow, drop the time left instead of falling further behind
+                accumulator = min(accumulator, TICK)
+            if render:
+                self.render(accumulator / TICK)
+            self.clock.tick(MAX_FPS)
+        return self.frame, time.perf_counter() - start
+
+    def step(self, events=None):
+        """
+        One simulation tick
+        :param events: key presses read before, they are read now if None
+        """
+        if events is None:
+            events = self.handle_window(self.input_source.events(self.frame))
+        self.handle_input(events)
+        self.update()
+
+    def handle_window(self, events):
+        """
+        Handles the window events
+        :return: the other events, for the next tick
+        """
+        rest = []
+        for event in events:
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                sys.exit()
+            self.presenter.handle_event(event)
+            if event.type in (pygame.KEYDOWN, pygame.KEYUP):
+                rest.append(event)
+        return rest
+
+    def handle_input(self, events):
+        for event in events:
+            # keyboard events
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_a:
+                    self.movement[0] = True
+                if event.key == pygame.K_d:
+                    self.movement[1] = True
+                if event.key == pygame.K_w:
+                    if self.player.jump():
+                        self.sfx["jump"].play()
+                if event.key == pygame.K_l:
+                    self.player.dash()
+            if event.type == pygame.KEYUP:
+                if event.key == pygame.K_a:
+                    self.movement[0] = False
+                if event.key == pygame.K_d:
+                    self.movement[1] = False
+
+    def update(self):
+        self.frame += 1
+        self.screenshake = max(0, self.screenshake - 1)
+
+        if not len(self.enemies):
+            self.transition += 1
+            # load new level when it is complete black
+            if self.transition > 30:
+                # a level can be saved both as .json and .tmap
+                levels = {os.path.splitext(name)[0] for name in os.listdir("data/maps")}
+                self.level = (self.level + 1) % len(levels)
+                self.load_level(self.level)
+        if self.transition < 0:
+            self.transition += 1
+
+        # gives 40 frames to player disapear before reload level
+        if self.dead:
+            self.dead += 1
+            if self.dead >= 10:
+                self.transition = min(self.transition + 1, 30)
+            if self.dead > 40:
+                self.load_level(self.level)
+
+        # update camera to follow player with delay
+        self.last_scroll[:] = self.scroll
+        self.scroll[0] += (
+            self.player.rect().centerx - self.display.get_width() / 2 - self.scroll[0]
+        ) / 30
+        self.scroll[1] += (
+            self.player.rect().centery - self.display.get_height() / 2 - self.scroll[1]
+        ) / 30
+
+        if self.streamer:
+            self.streamer.update(
+                self.scroll, self.display.get_size(), anchors=[self.player.pos]
+            )
+
+        view_rect = pygame.Rect(
+            int(self.scroll[0]), int(self.scroll[1]), *self.display.get_size()
+        )
+        self.leaf_emitters.update(view_rect)
+
+        self.clouds.update()
+
+        # the enemies move in three passes so the physics runs on all of them
+        # at once: AI, batched physics, then animation
+        nearby = self.enemies
+        lod = self.activity and len(self.enemies) >= LOD_MIN_ENEMIES
+        if lod:
+            # the sleeping enemies aren't even looked at
+            self.activity.update(view_rect, self.player.rect())
+            nearby = self.spatial.query_rect(self.activity.throttle_rect, "enemy")
+        active = []
+        for enemy in nearby:
+            # wait until the ground under an enemy is streamed in
+            if self.streamer and not self.streamer.is_loaded(enemy.pos):
+                continue
+            if not lod or self.activity.should_update(enemy):
+                active.append(enemy)
+        for enemy in active:
+            enemy.remember_pos()
+        movements = [enemy.think(self.tilemap, (0, 0)) for enemy in active]
+        self.physics.update(active, self.tilemap, movements)
+        for enemy, movement in zip(active, movements):
+            enemy.react(movement)
+            self.spatial.move(enemy, enemy.rect(), "enemy")
+
+        # player hits enemies with a dash
+        if abs(self.player.dashing) >= 50:
+            killed = self.spatial.query_rect(self.player.rect(), "enemy")
+            for enemy in killed:
+                enemy.hit()
+                self.spatial.remove(enemy)
+            # keep the enemies that survive, instead of removing the killed ones
+            if killed:
+                killed = set(killed)
+                self.enemies = [enemy for enemy in self.enemies if enemy not in killed]
+
+        if not self.dead:
+            self.player.remember_pos()
+            self.player.update(self.tilemap, (self.movement[1] - self.movement[0], 0))
+        self.spatial.move(self.player, self.player.rect(), "player")
+
+        # projectiles hit the player when the player is not invencible
+        walls, velocities, hits = self.projectiles.update(
+            self.tilemap,
+            self.spatial if abs(self.player.dashing) < 50 else None,
+            "player",
+        )
+        for point, velocity in zip(walls.tolist(), velocities.tolist()):
+            for i in range(4):
+                self.sparks.add(
+                    point,
+                    # check if wall is left or right
+                    random.random() - 0.5 + (math.pi if velocity[0] > 0 else 0),
+                    2 + random.random(),
                 )
-                self.player.render(self.display, offset=render_scroll)
-
-            # [[x, y], direction, timer]
-            for projectile in self.projectiles:
-                projectile[0] = projectile[0][0] + projectile[1], projectile[0][1]
-                projectile[2] += 1.0
-                img = self.assets["projectile"]
-                self.display.blit(
-                    img,
-                    (
-                        projectile[0][0] - img.get_width() / 2 - render_scroll[0],
-                        projectile[0][1] - img.get_height() / 2 - render_scroll[1],
-                    ),
+        for target in hits:
+            self.dead += 1
+            self.sfx["hit"].play()
+            self.screenshake = max(16, self.screenshake)
+            for i in range(30):
+                angle = random.random() * math.pi * 2
+                speed = random.random() * 5
+                self.sparks.add(
+                    self.player.rect().center,
+                    angle,
+                    speed,
                 )
-                # projectile hits wall
-                if self.tilemap.solid_check(projectile[0]):
-                    self.projectiles.remove(projectile)
-                    for i in range(4):
-                        self.sparks.append(
-                            Spark(
-                                projectile[0],
-                                # check if wall is left or right
-                                random.random()
-                                - 0.5
-                                + (math.pi if projectile[1] > 0 else 0),
-                                2 + random.random(),
-                            )
-                        )
-                # projectile timeout
-                elif projectile[2] > 360.0:
-                    self.projectiles.remove(projectile)
-                # projectile hits player when player is not invencible
-                elif abs(self.player.dashing) < 50:
-                    if self.player.rect().collidepoint(projectile[0]):
-                        self.projectiles.remove(projectile)
-                        self.dead += 1
-                        self.sfx["hit"].play()
-                        self.screenshake = max(16, self.screenshake)
-                        for i in range(30):
-                            angle = random.random() * math.pi * 2
-                            speed = random.random() * 5
-                            self.sparks.append(
-                                Spark(
-                                    self.player.rect().center,
-                                    angle,
-                                    speed,
-                                )
-                            )
-                            self.particles.append(
-                                Particle(
-                                    self,
-                                    "particle",
-                                    self.player.rect().center,
-                                    velocity=[
-                                        math.cos(angle + math.pi) * speed * 0.5,
-                                        math.sin(angle + math.pi) * speed * 0.5,
-                                    ],
-                                    frame=random.randint(0, 7),
-                                )
-                            )
-
-            for spark in self.sparks.copy():
-                kill = spark.update()
-                spark.render(self.display, render_scroll)
-                if kill:
-                    self.sparks.remove(spark)
-
-            display_mark = pygame.mask.from_surface(self.display)
-            display_sillhouette = display_mark.to_surface(
-                setcolor=(0, 0, 0, 180), unsetcolor=(0, 0, 0, 0)
-            )
-            for offset in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                self.display_2.blit(display_sillhouette, offset)
-
-            for particle in self.particles.copy():
-                particle.render(self.display, render_scroll)
-                # move leaf left/right, although the velocity is a little to the left
-                if particle.type == "leaf":
-                    particle.pos[0] += math.sin(particle.animation.frame * 0.035) * 0.3
-                if particle.update():
-                    self.particles.remove(particle)
-
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
-
-                # keyboard events
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_a:
-                        self.movement[0] = True
-                    if event.key == pygame.K_d:
-                        self.movement[1] = True
-                    if event.key == pygame.K_w:
-                        if self.player.jump():
-                            self.sfx["jump"].play()
-                    if event.key == pygame.K_l:
-                        self.player.dash()
-                if event.type == pygame.KEYUP:
-                    if event.key == pygame.K_a:
-                        self.movement[0] = False
-                    if event.key == pygame.K_d:
-                        self.movement[1] = False
-
-            if self.transition:
-                transition_surf = pygame.Surface(self.display.get_size())
-                pygame.draw.circle(
-                    transition_surf,
-                    "white",
-                    self.display.get_rect().center,
-                    (30 - abs(self.transition)) * 8,
+                self.particles.add(
+                    "particle",
+                    self.player.rect().center,
+                    velocity=[
+                        math.cos(angle + math.pi) * speed * 0.5,
+                        math.sin(angle + math.pi) * speed * 0.5,
+                    ],
+                    frame=random.randint(0, 7),
                 )
-                transition_surf.set_colorkey("white")
-                self.display.blit(transition_surf, (0, 0))
 
-            self.display_2.blit(self.display, (0, 0))
+        self.sparks.update()
+
+        self.particles.update()
+
+    def render(self, alpha=1.0):
+        """
+        :param alpha: draws between the last two ticks, 0 at the tick before,
+            1 at the last tick
+        """
+        # clear screen
+        self.display.fill((0, 0, 0, 0))
+        self.display_2.blit(self.assets["background"], (0, 0))
+
+        scroll = self.scroll
+        if alpha < 1:
+            scroll = [
+                self.scroll[0] + (self.last_scroll[0] - self.scroll[0]) * (1 - alpha),
+                self.scroll[1] + (self.last_scroll[1] - self.scroll[1]) * (1 - alpha),
+            ]
+        render_scroll = int(scroll[0]), int(scroll[1])
 
-            screenshake_offset = (
-                random.random() * self.screenshake - self.screenshake / 2,
-                random.random() * self.screenshake - self.screenshake / 2,
+        self.clouds.render(self.display_2, render_scroll)
+
+        self.tilemap.render(self.display, offset=render_scroll)
+
+        # areas drawn by moving things, the outline mask is read from these only
+        dynamic_rects: list[pygame.Rect] = []
+
+        # enemies off screen aren't drawn, the margin covers the gun
+        view_rect = self.display.get_rect().inflate(32, 32).move(render_scroll)
+        for enemy in self.enemies:
+            if view_rect.colliderect(enemy.rect()):
+                dynamic_rects.append(enemy.render(self.display, render_scroll, alpha))
+
+        if not self.dead:
+            dynamic_rects.append(
+                self.player.render(self.display, offset=render_scroll, alpha=alpha)
             )
-            self.screen.blit(
-                pygame.transform.scale(self.display_2, self.screen.get_size()),
-                screenshake_offset,
+
+        dynamic_rects.extend(
+            self.projectiles.render(
+                self.display, self.assets["projectile"], render_scroll, alpha
             )
+        )
+
+        dynamic_rects.extend(self.sparks.render(self.display, render_scroll))
+
+        # the outline of the tiles comes from the masks baked with the chunks
+        display_mark = pygame.mask.Mask(self.display.get_size())
+        self.tilemap.render_mask(display_mark, render_scroll)
+        display_rect = self.display.get_rect()
+        for rect in dynamic_rects:
+            if rect is None:
+                continue
+            rect = rect.clip(display_rect)
+            if rect.width and rect.height:
+                display_mark.draw(
+                    pygame.mask.from_surface(self.display.subsurface(rect)),
+                    rect.topleft,
+                )
+        display_sillhouette = display_mark.to_surface(
+            setcolor=(0, 0, 0, 180), unsetcolor=(0, 0, 0, 0)
+        )
+        for offset in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+            self.display_2.blit(display_sillhouette, offset)
+
+        self.particles.render(self.display, render_scroll)
+
+        if self.transition:
+            self.transition_effect.render(self.display, abs(self.transition))
 
-            # debug = self.font.render("Dash " + str(self.player.dashing), 1, "black")
-            # self.screen.blit(debug, (10, 10))
+        self.display_2.blit(self.display, (0, 0))
 
-            pygame.display.update()
-            self.clock.tick(60)
+        screenshake_offset = (
+            self.render_random.random() * self.screenshake - self.screenshake / 2,
+            self.render_random.random() * self.screenshake - self.screenshake / 2,
+        )
+        # debug = self.font.render("Dash " + str(self.player.dashing), 1, "black")
+        # self.display_2.blit(debug, (5, 5))
+
+        self.presenter.present(self.display_2, screenshake_offset)
 
     def load_level(self, map_id):
-        self.tilemap.load("data/maps/" + str(map_id) + ".json")
+        if self.streamer:
+            self.streamer.close()
+            self.streamer = None
+
+        # big worlds are streamed in chunks around the camera
+        # prefer the binary map, it loads faster
+        world = "data/worlds/" + str(map_id)
+        path = "data/maps/" + str(map_id)
+        if os.path.exists(os.path.join(world, MANIFEST)):
+            self.streamer = ChunkStreamer(self.tilemap, world)
+            objects = self.streamer
+        elif os.path.exists(path + mapformat.EXTENSION):
+            self.tilemap.load(path + mapformat.EXTENSION)
+            objects = self.tilemap
+        else:
+            self.tilemap.load(path + ".json")
+            objects = self.tilemap
 
         self.dead = 0
 
-        self.leaf_spawners = []
-        for tree in self.tilemap.extract([("large_decor", 2)], keep=True):
-            self.leaf_spawners.append(
+        self.leaf_emitters.set_rects(
+            [
                 pygame.Rect(4 + tree["pos"][0], 4 + tree["pos"][1], 23, 13)
-            )
+                for tree in objects.extract([("large_decor", 2)], keep=True)
+            ]
+        )
 
         self.enemies = []
-        for spawner in self.tilemap.extract([("spawners", 0), ("spawners", 1)]):
+        self.spatial.clear()
+        if self.activity:
+            self.activity.reset()
+        for spawner in objects.extract([("spawners", 0), ("spawners", 1)]):
             if spawner["variant"] == 0:
                 self.player.pos = spawner["pos"]
                 self.player.air_time = 0
@@ -322,17 +503,100 @@ class Game:
                 self.player.dashing = False
             else:
                 self.enemies.append(Enemy(self, spawner["pos"], (8, 15)))
+        # enemies that don't move stay where they were added
+        for enemy in self.enemies:
+            self.spatial.move(enemy, enemy.rect(), "enemy")
+        self.spatial.move(self.player, self.player.rect(), "player")
 
-        self.particles: list[Particle] = []
-        # [[x, y], direction, timer]
-        self.projectiles: list[list[Union[tuple[float, float], float]]] = []
+        self.particles.clear()
+        self.projectiles.clear()
 
         # camera
         self.scroll = [0.0, 0.0]
+        self.last_scroll = [0.0, 0.0]
 
         self.clouds = Clouds(self.assets["clouds"], 16)
 
         self.transition = -30
 
 
-Game().run()
+def main():
+    parser = argparse.ArgumentParser(description="Ninja Game")
+    parser.add_argument(
+        "--headless",
+        action="store_true",
+        help="no window and no sound, runs as fast as possible",
+    )
+    parser.add_argument("--frames", type=int, help="stop after this many frames")
+    parser.add_argument("--seed", type=int, help="seed for the random numbers")
+    parser.add_argument(
+        "--inputs", help="JSON file with scripted key presses, see scripts/inputs.py"
+    )
+    parser.add_argument(
+        "--no-render", action="store_true", help="only simulate, don't draw"
+    )
+    parser.add_argument(
+        "--scaler",
+        choices=BACKENDS,
+        default="scale",
+        help="how the game is scaled up to the window",
+    )
+    parser.add_argument(
+        "--integer-scale",
+        action="store_true",
+        help="only scale by whole numbers, with black bars around",
+    )
+    parser.add_argument(
+        "--startup-report",
+        action="store_true",
+        help="print how long each asset took to load",
+    )
+    parser.add_argument(
+        "--transition",
+        choices=list(TRANSITIONS),
+        default="iris",
+        help="effect between levels",
+    )
+    parser.add_argument(
+        "--time-scale",
+        type=float,
+        default=1.0,
+        help="game speed, e.g. 2 to fast forward (not for headless runs)",
+    )
+    parser.add_argument(
+        "--no-lod",
+        action="store_true",
+        help="update every enemy every frame, wherever it is",
+    )
+    args = parser.parse_args()
+    if args.time_scale <= 0:
+        parser.error("--time-scale must be positive")
+
+    input_source = ScriptedInput.load(args.inputs) if args.inputs else None
+    start = time.perf_counter()
+    game = Game(
+        headless=args.headless,
+        seed=args.seed,
+        input_source=input_source,
+        transition=args.transition,
+        scaler=args.scaler,
+        integer_scale=args.integer_scale,
+        lod=not args.no_lod,
+        time_scale=args.time_scale,
+    )
+    if args.startup_report:
+        print("startup", round((time.perf_counter() - start) * 1000, 2), "ms")
+        print(game.asset_manager.report())
+    frames, seconds = game.run(args.frames, render=not args.no_render)
+    print(
+        frames,
+        "frames in",
+        round(seconds, 3),
+        "s,",
+        round(frames / max(seconds, 1e-9)),
+        "frames/s",
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import pygame
+
+# how much simulation an entity gets
+AWAKE = 0
+THROTTLED = 1
+ASLEEP = 2
+
+
+class ActivityRegions:
+    def __init__(self, awake_margin=96, throttle_margin=256, interval=4):
+        """
+        Level of detail of the simulation by distance to the view and the player.
+        Close entities update every frame, farther ones every interval frames
+        and the rest sleep until the view or the player comes near
+        :param awake_margin: entities this far out of the view update every frame
+        :param throttle_margin: entities this far out of the view are throttled
+        :param interval: frames between the updates of a throttled entity
+        """
+        self.awake_margin = awake_margin
+        self.throttle_margin = throttle_margin
+        self.interval = interval
+        self.frame = 0
+        self.awake_rect = pygame.Rect(0, 0, 0, 0)
+        # everything out of it sleeps, query the entities in it
+        self.throttle_rect = pygame.Rect(0, 0, 0, 0)
+        # throttled entities are spread over the frames, id(entity) -> offset
+        self.phases: dict[int, int] = {}
+
+    def reset(self):
+        self.phases = {}
+
+    def update(self, view_rect: pygame.Rect, player_rect: pygame.Rect):
+        # the camera lags behind the player, both wake entities up
+        self.frame += 1
+        near = view_rect.union(player_rect)
+        self.awake_rect = near.inflate(self.awake_margin * 2, self.awake_margin * 2)
+        self.throttle_rect = near.inflate(
+            self.throttle_margin * 2, self.throttle_margin * 2
+        )
+
+    def level(self, rect: pygame.Rect):
+        """
+        :return: AWAKE, THROTTLED or ASLEEP
+        """
+        if self.awake_rect.colliderect(rect):
+            return AWAKE
+        if self.throttle_rect.colliderect(rect):
+            return THROTTLED
+        return ASLEEP
+
+    def should_update(self, entity):
+        # entity must have a rect() method
+        level = self.level(entity.rect())
+        if level == AWAKE:
+            return True
+        if level == ASLEEP:
+            return False
+        phase = self.phases.setdefault(id(entity), len(self.phases) % self.interval)
+        return (self.frame + phase) % self.interval == 0
@@ -0,0 +1,175 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+import os
+import time
+import pygame
+
+from scripts import utils
+from scripts.utils import BASE_IMAGE_PATH, convert_image, Animation
+
+# every asset of the game and the editor
+#   image      one file under data/images
+#   images     all the files of a folder under data/images, sorted by name
+#   animation  images of a folder in an Animation, options are Animation's
+#   sound      a file, option volume
+MANIFEST = {
+    "player": ("image", "entities/player.png", {}),
+    "decor": ("images", "tiles/decor", {}),
+    "grass": ("images", "tiles/grass", {}),
+    "large_decor": ("images", "tiles/large_decor", {}),
+    "stone": ("images", "tiles/stone", {}),
+    "spawners": ("images", "tiles/spawners", {}),
+    "background": ("image", "background.png", {}),
+    "gun": ("image", "gun.png", {}),
+    "projectile": ("image", "projectile.png", {}),
+    "clouds": ("images", "clouds", {}),
+    "player/idle": ("animation", "entities/player/idle", {"img_duration": 6}),
+    "player/jump": ("animation", "entities/player/jump", {}),
+    "player/run": ("animation", "entities/player/run", {"img_duration": 4}),
+    "player/slide": ("animation", "entities/player/slide", {}),
+    "player/wall_slide": ("animation", "entities/player/wall_slide", {}),
+    "enemy/idle": ("animation", "entities/enemy/idle", {"img_duration": 6}),
+    "enemy/run": ("animation", "entities/enemy/run", {"img_duration": 4}),
+    # at the end of the animation loop, stop looping. Particles are marked for
+    # deleting at the end of Animation
+    "particle/leaf": (
+        "animation",
+        "particles/leaf",
+        {"img_duration": 20, "loop": False},
+    ),
+    "particle/particle": (
+        "animation",
+        "particles/particle",
+        {"img_duration": 6, "loop": False},
+    ),
+    "sfx/jump": ("sound", "data/sfx/jump.wav", {"volume": 0.7}),
+    "sfx/dash": ("sound", "data/sfx/dash.wav", {"volume": 0.3}),
+    "sfx/hit": ("sound", "data/sfx/hit.wav", {"volume": 0.8}),
+    "sfx/shoot": ("sound", "data/sfx/shoot.wav", {"volume": 0.4}),
+    "sfx/ambience": ("sound", "data/sfx/ambience.wav", {"volume": 0.2}),
+}
+
+GAME_ASSETS = [
+    "player",
+    "decor",
+    "grass",
+    "large_decor",
+    "stone",
+    "background",
+    "gun",
+    "projectile",
+    "clouds",
+    "player/idle",
+    "player/jump",
+    "player/run",
+    "player/slide",
+    "player/wall_slide",
+    "enemy/idle",
+    "enemy/run",
+    "particle/leaf",
+    "particle/particle",
+]
+GAME_SOUNDS = ["sfx/jump", "sfx/dash", "sfx/hit", "sfx/shoot", "sfx/ambience"]
+# the order is the order of the tile groups in the editor
+EDITOR_ASSETS = ["decor", "grass", "large_decor", "stone", "spawners"]
+
+
+def image_files(kind, path):
+    if kind == "image":
+        return [path]
+    return [path + "/" + name for name in sorted(os.listdir(BASE_IMAGE_PATH + path))]
+
+
+def read_asset(kind, path):
+    # runs in the thread pool, file reads and decoding only
+    # converting to the display format is left to the main thread
+    start = time.perf_counter()
+    if kind == "sound":
+        data = pygame.mixer.Sound(path)
+    else:
+        data = []
+        for file in image_files(kind, path):
+            if utils.atlas is not None and utils.atlas.region(file) is not None:
+                # already decoded in the atlas sheet
+                data.append(file)
+            else:
+                data.append(pygame.image.load(BASE_IMAGE_PATH + file))
+    return data, time.perf_counter() - start
+
+
+class AssetManager:
+    def __init__(self, manifest=None, workers=None):
+        """
+        Loads assets from the manifest, decoding them in parallel
+        :param workers: threads for reading and decoding, one loads in order
+        """
+        self.manifest = MANIFEST if manifest is None else manifest
+        self.workers = workers or min(8, os.cpu_count() or 1)
+        # seconds spent on each asset, for report()
+        self.timings: dict[str, float] = {}
+        self.lazy: dict[str, Callable] = {}
+        self.loaded_lazy = {}
+
+    def use_atlas(self):
+        # images come from the packed sheets when build_atlas.py was run
+        start = time.perf_counter()
+        if utils.use_atlas():
+            self.timings["atlas sheets"] = time.perf_counter() - start
+
+    def load(self, names):
+        """
+        :return: {name: asset} in the order of names
+        """
+        start = time.perf_counter()
+        jobs = [self.manifest[name][:2] for name in names]
+        if self.workers > 1 and len(jobs) > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                results = list(executor.map(lambda job: read_asset(*job), jobs))
+        else:
+            results = [read_asset(*job) for job in jobs]
+
+        assets = {}
+        for name, (data, seconds) in zip(names, results):
+            kind, path, options = self.manifest[name]
+            convert_start = time.perf_counter()
+            if kind == "sound":
+                asset = data
+                asset.set_volume(options.get("volume", 1.0))
+            else:
+                images = [
+                    (
+                        utils.load_image(img)
+                        if isinstance(img, str)
+                        else convert_image(img)
+                    )
+                    for img in data
+                ]
+                if kind == "image":
+                    asset = images[0]
+                elif kind == "images":
+                    asset = images
+                else:
+                    asset = Animation(images, **options)
+            assets[name] = asset
+            self.timings[name] = seconds + time.perf_counter() - convert_start
+        self.timings["total (wall)"] = time.perf_counter() - start
+        return assets
+
+    def add_lazy(self, name, factory):
+        # rarely used assets are made the first time they are asked for
+        self.lazy[name] = factory
+
+    def get_lazy(self, name):
+        if name not in self.loaded_lazy:
+            start = time.perf_counter()
+            self.loaded_lazy[name] = self.lazy[name]()
+            self.timings[name + " (lazy)"] = time.perf_counter() - start
+        return self.loaded_lazy[name]
+
+    def report(self):
+        lines = ["startup assets, " + str(self.workers) + " workers"]
+        for name, seconds in sorted(self.timings.items(), key=lambda item: -item[1]):
+            lines.append(
+                "  " + name.ljust(20) + " " + format(seconds * 1000, "7.2f") + " ms"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,119 @@
+import json
+import os
+import pygame
+
+MANIFEST = "atlas.json"
+
+
+def pack(sizes, sheet_size):
+    """
+    Shelf packing, the tallest images first, rows are filled left to right
+    :param sizes: {name: (width, height)}
+    :return: {name: (sheet, x, y)}
+    """
+    places = {}
+    sheet = x = y = shelf_height = 0
+    for name in sorted(sizes, key=lambda name: (-sizes[name][1], name)):
+        width, height = sizes[name]
+        if width > sheet_size or height > sheet_size:
+            raise ValueError(name + " doesn't fit in a sheet of " + str(sheet_size))
+        if x + width > sheet_size:
+            # next shelf
+            x = 0
+            y += shelf_height
+            shelf_height = 0
+        if y + height > sheet_size:
+            # next sheet
+            sheet += 1
+            x = y = shelf_height = 0
+        places[name] = (sheet, x, y)
+        x += width
+        shelf_height = max(shelf_height, height)
+    return places
+
+
+def build_atlas(image_path, folder, sheet_size=512):
+    """
+    Packs every png under image_path in a few sheets and writes them to folder
+    with a manifest of where each image is.
+    The images are converted like load_image does, so the display must be set
+    """
+    names = []
+    for root, dirs, files in os.walk(image_path):
+        for file in files:
+            if file.endswith(".png"):
+                path = os.path.join(root, file)
+                names.append(os.path.relpath(path, image_path).replace(os.sep, "/"))
+
+    images = {name: pygame.image.load(image_path + name).convert() for name in names}
+    places = pack({name: img.get_size() for name, img in images.items()}, sheet_size)
+
+    # sheets are cut to the area used, less pixels to decode when loading
+    used = {}
+    for name, (sheet, x, y) in places.items():
+        width, height = used.get(sheet, (0, 0))
+        used[sheet] = (
+            max(width, x + images[name].get_width()),
+            max(height, y + images[name].get_height()),
+        )
+    sheets = []
+    for sheet in range(len(used)):
+        surf = pygame.Surface(used[sheet], 0, next(iter(images.values())))
+        surf.fill((0, 0, 0))
+        sheets.append(surf)
+    for name, (sheet, x, y) in places.items():
+        sheets[sheet].blit(images[name], (x, y))
+
+    os.makedirs(folder, exist_ok=True)
+    sheet_files = []
+    for i, surf in enumerate(sheets):
+        sheet_files.append("sheet_" + str(i) + ".png")
+        pygame.image.save(surf, os.path.join(folder, sheet_files[-1]))
+
+    manifest = {"sheets": sheet_files, "images": {}}
+    for name, (sheet, x, y) in sorted(places.items()):
+        manifest["images"][name] = {
+            "sheet": sheet,
+            "rect": [x, y, *images[name].get_size()],
+            # the atlas is ignored for images changed after it was built
+            "mtime": os.path.getmtime(image_path + name),
+        }
+    with open(os.path.join(folder, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+class Atlas:
+    def __init__(self, folder, image_path=None):
+        """
+        Images packed by build_atlas, each one is a subsurface of its sheet
+        :param image_path: where the original images are, to skip the outdated ones
+        """
+        with open(os.path.join(folder, MANIFEST), "r") as f:
+            manifest = json.load(f)
+        self.sheets = [
+            pygame.image.load(os.path.join(folder, sheet)).convert()
+            for sheet in manifest["sheets"]
+        ]
+        self.images = manifest["images"]
+        self.image_path = image_path
+
+    def region(self, name):
+        """
+        :return: (sheet, rect) to blit the image with the area argument,
+            None if the image isn't in the atlas or changed since it was built
+        """
+        entry = self.images.get(name)
+        if entry is None:
+            return None
+        if self.image_path is not None:
+            path = self.image_path + name
+            if os.path.exists(path) and os.path.getmtime(path) > entry["mtime"]:
+                return None
+        return self.sheets[entry["sheet"]], pygame.Rect(entry["rect"])
+
+    def get(self, name):
+        region = self.region(name)
+        if region is None:
+            return None
+        return region[0].subsurface(region[1])
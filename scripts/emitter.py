@@ -0,0 +1,111 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+import math
+import random
+import numpy as np
+import pygame
+
+if TYPE_CHECKING:
+    from scripts.particle import ParticleSystem
+
+
+class Emitters:
+    def __init__(
+        self,
+        particles: ParticleSystem,
+        p_type,
+        area_rate,
+        velocity=(0, 0),
+        max_start_frame=0,
+        budget=16,
+        margin=128,
+        rng: random.Random = None,
+    ):
+        """
+        Rects that spawn particles at random times, e.g. leaves falling from trees.
+        Instead of rolling a chance every frame, each emitter draws the frame of its
+        next emission, so idle emitters cost nothing
+        :param area_rate: chance of emitting per frame is rect area / area_rate
+        :param max_start_frame: particles start in a random frame up to this
+        :param budget: max living particles from one emitter
+        :param margin: emitters this far out of the view still emit (particles drift in)
+        :param rng: random generator, the emitters don't touch the global one
+        """
+        self.particles = particles
+        self.p_type = p_type
+        self.area_rate = area_rate
+        self.velocity = list(velocity)
+        self.max_start_frame = max_start_frame
+        self.budget = budget
+        self.margin = margin
+        self.rng = rng or random.Random()
+        self.frame = 0
+        self.set_rects([])
+
+    def set_rects(self, rects: list[pygame.Rect]):
+        self.rects = [pygame.Rect(rect) for rect in rects]
+        # left, top, right, bottom
+        self.bounds = np.array(
+            [(r.left, r.top, r.right, r.bottom) for r in self.rects], dtype=float
+        ).reshape(-1, 4)
+        self.chance = np.array(
+            [min(1.0, r.width * r.height / self.area_rate) for r in self.rects]
+        )
+        # frame of the next emission, only meaningful while active
+        self.next_frame = np.zeros(len(self.rects), dtype=np.int64)
+        self.active = np.zeros(len(self.rects), dtype=bool)
+
+    def wait(self, chance):
+        # frames until the next emission when each frame has this chance
+        # (geometric distribution, the discrete version of exponential waiting)
+        if chance >= 1:
+            return 1
+        if chance <= 0:
+            return 1 << 62
+        return 1 + int(math.log(1.0 - self.rng.random()) / math.log(1.0 - chance))
+
+    def update(self, view: pygame.Rect):
+        """
+        Emits the due particles of the emitters near the view
+        :param view: camera rect in world coordinates
+        """
+        self.frame += 1
+        if not self.rects:
+            return
+
+        bounds = self.bounds
+        visible = (
+            (bounds[:, 2] > view.left - self.margin)
+            & (bounds[:, 0] < view.right + self.margin)
+            & (bounds[:, 3] > view.top - self.margin)
+            & (bounds[:, 1] < view.bottom + self.margin)
+        )
+        # emitters coming into view start waiting from now,
+        # the wait has no memory so skipping the time off screen changes nothing
+        for i in np.flatnonzero(visible & ~self.active).tolist():
+            self.next_frame[i] = self.frame - 1 + self.wait(self.chance[i])
+        self.active = visible
+
+        due = np.flatnonzero(visible & (self.next_frame <= self.frame)).tolist()
+        if not due:
+            return
+
+        particles = self.particles
+        owner = particles.owner[: particles.count]
+        alive = np.bincount(owner[owner >= 0], minlength=len(self.rects))
+        for i in due:
+            self.next_frame[i] = self.frame + self.wait(self.chance[i])
+            if alive[i] >= self.budget:
+                continue
+            rect = self.rects[i]
+            pos = (
+                rect.x + self.rng.random() * rect.width,
+                rect.y + self.rng.random() * rect.height,
+            )
+            particles.add(
+                self.p_type,
+                pos,
+                velocity=self.velocity,
+                frame=self.rng.randint(0, self.max_start_frame),
+                owner=i,
+            )
@@ -4,14 +4,10 @@ import pygame
 import math
 import random
 
-
 if TYPE_CHECKING:
     from game import Game
     from scripts.tilemap import Tilemap
 
-from scripts.particle import Particle
-from scripts.spark import Spark
-
 
 class PhysicsEntity:
     def __init__(self, game: Game, e_type, pos, size):
@@ -29,6 +25,27 @@ class PhysicsEntity:
         self.set_action("idle")
 
         self.last_movement = [0.0, 0.0]
+        # position before the last tick, to draw between ticks
+        self.last_pos = list(self.pos)
+        self.last_frame = -1
+
+    def remember_pos(self):
+        # called before the tick that moves the entity
+        self.last_pos[:] = self.pos
+        self.last_frame = self.game.frame
+
+    def render_pos(self, alpha=1.0):
+        """
+        Position to draw at, between the last two ticks
+        :param alpha: 0 at the tick before, 1 at the last tick
+        """
+        if alpha >= 1 or self.last_frame != self.game.frame:
+            # not moved by the last tick, e.g. a sleeping enemy
+            return self.pos
+        return (
+            self.pos[0] + (self.last_pos[0] - self.pos[0]) * (1 - alpha),
+            self.pos[1] + (self.last_pos[1] - self.pos[1]) * (1 - alpha),
+        )
 
     def update(self, tilemap: Tilemap, movement=(0, 0)):
         self.collisions = {"up": False, "down": False, "right": False, "left": False}
@@ -68,7 +85,10 @@ class PhysicsEntity:
         if self.collisions["down"] or self.collisions["up"]:
             self.velocity[1] = 0
 
-        # animation
+        self.update_animation(movement)
+
+    def update_animation(self, movement):
+        # after the physics, also called by BatchPhysics
         if movement[0] > 0:
             self.flip = False
         if movement[0] < 0:
@@ -77,18 +97,25 @@ class PhysicsEntity:
 
         self.animation.update()
 
-    def render(self, surf: pygame.Surface, offset=(0, 0)):
-        surf.blit(
-            pygame.transform.flip(self.animation.img(), self.flip, False),
+    def render(self, surf: pygame.Surface, offset=(0, 0), alpha=1.0):
+        # returns the area drawn, like blit
+        pos = self.render_pos(alpha)
+        return surf.blit(
+            self.animation.img(self.flip),
             (
-                self.pos[0] - offset[0] + self.anim_offset[0],
-                self.pos[1] - offset[1] + self.anim_offset[1],
+                pos[0] - offset[0] + self.anim_offset[0],
+                pos[1] - offset[1] + self.anim_offset[1],
             ),
         )
 
     def rect(self):
         return pygame.Rect(self.pos[0], self.pos[1], self.size[0], self.size[1])
 
+    def render_rect(self, alpha=1.0):
+        # rect at render_pos
+        pos = self.render_pos(alpha)
+        return pygame.Rect(pos[0], pos[1], self.size[0], self.size[1])
+
     def set_action(self, action):
         if action != self.action:
             self.action = action
@@ -142,14 +169,8 @@ class Player(PhysicsEntity):
                 angle = random.random() * math.pi * 2
                 speed = random.random() * 0.5 + 0.5
                 pvelocity = [math.cos(angle) * speed, math.sin(angle) * speed]
-                self.game.particles.append(
-                    Particle(
-                        self.game,
-                        "particle",
-                        self.rect().center,
-                        pvelocity,
-                        random.randint(0, 7),
-                    )
+                self.game.particles.add(
+                    "particle", self.rect().center, pvelocity, random.randint(0, 7)
                 )
 
         if self.dashing > 0:
@@ -167,14 +188,8 @@ class Player(PhysicsEntity):
                 self.velocity[0] *= 0.1
             # stream of particles from begin to end of dash
             pvelocity = [abs(self.dashing) / self.dashing * random.random() * 3, 0]
-            self.game.particles.append(
-                Particle(
-                    self.game,
-                    "particle",
-                    self.rect().center,
-                    pvelocity,
-                    random.randint(0, 7),
-                )
+            self.game.particles.add(
+                "particle", self.rect().center, pvelocity, random.randint(0, 7)
             )
 
         if self.velocity[0] > 0:
@@ -214,9 +229,10 @@ class Player(PhysicsEntity):
             else:
                 self.dashing = 60
 
-    def render(self, surf: pygame.Surface, offset=(0, 0)):
+    def render(self, surf: pygame.Surface, offset=(0, 0), alpha=1.0):
         if abs(self.dashing) <= 50:
-            super().render(surf, offset)
+            return super().render(surf, offset, alpha)
+        return None
 
 
 class Enemy(PhysicsEntity):
@@ -225,7 +241,11 @@ class Enemy(PhysicsEntity):
 
         self.walking = 0
 
-    def update(self, tilemap: Tilemap, movement=(0, 0)):
+    def think(self, tilemap: Tilemap, movement=(0, 0)):
+        """
+        Walks, turns and shoots, before the physics
+        :return: the movement for the physics
+        """
         if self.walking:
             if tilemap.solid_check(
                 (self.rect().centerx + (-7 if self.flip else 7), self.pos[1] + 23)
@@ -243,99 +263,79 @@ class Enemy(PhysicsEntity):
                     self.game.player.pos[0] - self.pos[0],
                     self.game.player.pos[1] - self.pos[1],
                 )
-                # close Y distance, X can be far
-                if abs(dis[1]) < 16:
+                # close Y distance, X can be far, and no wall in between
+                if abs(dis[1]) < 16 and tilemap.line_of_sight(
+                    self.rect().center, self.game.player.rect().center
+                ):
                     # enemy looking left and player is on the left
                     if self.flip and dis[0] < 0:
                         self.game.sfx["shoot"].play()
-                        self.game.projectiles.append(
-                            [(self.rect().centerx - 7, self.rect().centery), -1.5, 0]
-                        )
+                        pos = (self.rect().centerx - 7, self.rect().centery)
+                        self.game.projectiles.add(pos, (-1.5, 0))
                         for i in range(4):
-                            self.game.sparks.append(
-                                Spark(
-                                    self.game.projectiles[-1][0],
-                                    random.random() - 0.5 + math.pi,
-                                    2 + random.random(),
-                                )
+                            self.game.sparks.add(
+                                pos,
+                                random.random() - 0.5 + math.pi,
+                                2 + random.random(),
                             )
                     # enemy looking right and player is on the right
                     if not self.flip and dis[0] > 0:
                         self.game.sfx["shoot"].play()
-                        self.game.projectiles.append(
-                            [(self.rect().centerx + 7, self.rect().centery), 1.5, 0]
-                        )
+                        pos = (self.rect().centerx + 7, self.rect().centery)
+                        self.game.projectiles.add(pos, (1.5, 0))
                         for i in range(4):
-                            self.game.sparks.append(
-                                Spark(
-                                    self.game.projectiles[-1][0],
-                                    random.random() - 0.5,
-                                    2 + random.random(),
-                                )
+                            self.game.sparks.add(
+                                pos,
+                                random.random() - 0.5,
+                                2 + random.random(),
                             )
         elif random.random() < 0.01:
             self.walking = random.randint(30, 120)
-        super().update(tilemap, movement)
+        return movement
 
+    def react(self, movement):
+        # after the physics
         if movement[0] != 0:
             self.set_action("run")
         else:
             self.set_action("idle")
 
-        # player hits enemy with a dash
-        if abs(self.game.player.dashing) >= 50:
-            if self.rect().colliderect(self.game.player.rect()):
-                self.game.screenshake = max(16, self.game.screenshake)
-                self.game.sfx["hit"].play()
-                for i in range(30):
-                    angle = random.random() * math.pi * 2
-                    speed = random.random() * 5
-                    self.game.sparks.append(
-                        Spark(
-                            self.rect().center,
-                            angle,
-                            speed,
-                        )
-                    )
-                    self.game.particles.append(
-                        Particle(
-                            self.game,
-                            "particle",
-                            self.rect().center,
-                            velocity=[
-                                math.cos(angle + math.pi) * speed * 0.5,
-                                math.sin(angle + math.pi) * speed * 0.5,
-                            ],
-                            frame=random.randint(0, 7),
-                        )
-                    )
-                # big sparks
-                self.game.sparks.append(
-                    Spark(self.rect().center, 0, 5 + random.random())
-                )
-                self.game.sparks.append(
-                    Spark(self.rect().center, math.pi, 5 + random.random())
-                )
-                return True
-
-        return False
+    def hit(self):
+        # killed by the player, the caller removes the enemy
+        self.game.screenshake = max(16, self.game.screenshake)
+        self.game.sfx["hit"].play()
+        for i in range(30):
+            angle = random.random() * math.pi * 2
+            speed = random.random() * 5
+            self.game.sparks.add(self.rect().center, angle, speed)
+            self.game.particles.add(
+                "particle",
+                self.rect().center,
+                velocity=[
+                    math.cos(angle + math.pi) * speed * 0.5,
+                    math.sin(angle + math.pi) * speed * 0.5,
+                ],
+                frame=random.randint(0, 7),
+            )
+        # big sparks
+        self.game.sparks.add(self.rect().center, 0, 5 + random.random())
+        self.game.sparks.add(self.rect().center, math.pi, 5 + random.random())
 
-    def render(self, surf: pygame.Surface, offset=(0, 0)):
-        super().render(surf, offset)
+    def render(self, surf: pygame.Surface, offset=(0, 0), alpha=1.0):
+        rect = super().render(surf, offset, alpha)
 
+        body = self.render_rect(alpha)
         if self.flip:
-            surf.blit(
-                pygame.transform.flip(self.game.assets["gun"], True, False),
+            gun_rect = surf.blit(
+                self.game.assets["gun/flipped"],
                 (
-                    self.rect().centerx
-                    - 4
-                    - self.game.assets["gun"].get_width()
-                    - offset[0],
-                    self.rect().centery - offset[1],
+                    body.centerx - 4 - self.game.assets["gun"].get_width() - offset[0],
+                    body.centery - offset[1],
                 ),
             )
         else:
-            surf.blit(
+            gun_rect = surf.blit(
                 self.game.assets["gun"],
-                (self.rect().centerx + 4 - offset[0], self.rect().centery - offset[1]),
+                (body.centerx + 4 - offset[0], body.centery - offset[1]),
             )
+        return rect.union(gun_rect)
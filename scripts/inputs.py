@@ -0,0 +1,46 @@
+import json
+import pygame
+
+
+class KeyboardInput:
+    def events(self, frame):
+        return pygame.event.get()
+
+
+class ScriptedInput:
+    def __init__(self, script):
+        """
+        Replays key presses, for headless runs
+        :param script: list of [frame, "down" or "up", key name] e.g. [120, "down", "d"]
+            key names are the same as pygame.key.key_code()
+        """
+        self.script = script
+        # frame -> key events, made on the first events() call because key
+        # codes need pygame.init(), the script is usually loaded before it
+        self.frames: dict[int, list[pygame.event.Event]] | None = None
+        self.last_frame = None
+
+    def build(self):
+        self.frames = {}
+        for frame, action, key in self.script:
+            event_type = pygame.KEYDOWN if action == "down" else pygame.KEYUP
+            self.frames.setdefault(frame, []).append(
+                pygame.event.Event(event_type, key=pygame.key.key_code(key))
+            )
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            return cls(json.load(f))
+
+    def events(self, frame):
+        # the window events still have to be pumped, but they are ignored
+        pygame.event.pump()
+        # the window can be polled several times per tick, a frame's keys
+        # are only pressed once
+        if frame == self.last_frame:
+            return []
+        self.last_frame = frame
+        if self.frames is None:
+            self.build()
+        return self.frames.get(frame, [])
@@ -0,0 +1,119 @@
+from array import array
+import mmap
+import struct
+import sys
+
+# binary map layout, all little endian
+#   header   magic, version, tile_size, chunk_size, types, chunks, offgrid tiles
+#   types    u16 length + utf-8 name, the index in this table is the type id
+#   chunks   i32 chunk_x, i32 chunk_y, i16 type ids[chunk_size^2], u8 variants[...]
+#            type id -1 is an empty cell
+#   offgrid  f64 x, f64 y, u16 type id, u16 variant
+MAGIC = b"TMAP"
+VERSION = 1
+EXTENSION = ".tmap"
+
+HEADER = struct.Struct("<4sHHHHII")
+NAME_LENGTH = struct.Struct("<H")
+CHUNK_POS = struct.Struct("<ii")
+OFFGRID_TILE = struct.Struct("<ddHH")
+
+
+class MapData:
+    def __init__(self, tile_size, chunk_size, names):
+        self.tile_size = tile_size
+        self.chunk_size = chunk_size
+        self.names: list[str] = names
+        # (chunk_x, chunk_y, types, variants)
+        self.chunks: list[tuple[int, int, array, array]] = []
+        # (x, y, type id, variant)
+        self.offgrid: list[tuple[float, float, int, int]] = []
+
+
+def write_map(path, map_data: MapData):
+    with open(path, "wb") as f:
+        f.write(
+            HEADER.pack(
+                MAGIC,
+                VERSION,
+                map_data.tile_size,
+                map_data.chunk_size,
+                len(map_data.names),
+                len(map_data.chunks),
+                len(map_data.offgrid),
+            )
+        )
+        for name in map_data.names:
+            encoded = name.encode()
+            f.write(NAME_LENGTH.pack(len(encoded)))
+            f.write(encoded)
+
+        for cx, cy, types, variants in map_data.chunks:
+            f.write(CHUNK_POS.pack(cx, cy))
+            if sys.byteorder == "big":
+                types = array("h", types)
+                types.byteswap()
+            f.write(types.tobytes())
+            f.write(variants.tobytes())
+
+        for tile in map_data.offgrid:
+            f.write(OFFGRID_TILE.pack(*tile))
+
+
+def read_map(path):
+    # the file is memory mapped, only the arrays we keep are copied out of it
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return parse_map(data)
+
+
+def parse_map(data) -> MapData:
+    # slices of a memoryview don't copy, released before the mmap is closed
+    with memoryview(data) as view:
+        return parse_view(view)
+
+
+def parse_view(data: memoryview) -> MapData:
+    (
+        magic,
+        version,
+        tile_size,
+        chunk_size,
+        type_count,
+        chunk_count,
+        offgrid_count,
+    ) = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("not a binary map file")
+    if version != VERSION:
+        raise ValueError("unsupported binary map version " + str(version))
+    offset = HEADER.size
+
+    names = []
+    for i in range(type_count):
+        (length,) = NAME_LENGTH.unpack_from(data, offset)
+        offset += NAME_LENGTH.size
+        names.append(str(data[offset : offset + length], "utf-8"))
+        offset += length
+    map_data = MapData(tile_size, chunk_size, names)
+
+    cells = chunk_size * chunk_size
+    for i in range(chunk_count):
+        cx, cy = CHUNK_POS.unpack_from(data, offset)
+        offset += CHUNK_POS.size
+        types = array("h")
+        types.frombytes(data[offset : offset + cells * 2])
+        if sys.byteorder == "big":
+            types.byteswap()
+        offset += cells * 2
+        variants = array("B")
+        variants.frombytes(data[offset : offset + cells])
+        offset += cells
+        map_data.chunks.append((cx, cy, types, variants))
+
+    for tile in OFFGRID_TILE.iter_unpack(
+        data[offset : offset + offgrid_count * OFFGRID_TILE.size]
+    ):
+        map_data.offgrid.append(tile)
+
+    return map_data
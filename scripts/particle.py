@@ -1,38 +1,118 @@
 from __future__ import annotations
 from typing import TYPE_CHECKING
+import numpy as np
 import pygame
 
+from scripts.pool import ArrayPool, DROP_OLDEST
+
 if TYPE_CHECKING:
     from game import Game
 
 
-class Particle:
-    def __init__(self, game: Game, p_type, pos, velocity=(0, 0), frame=0):
+class ParticleSystem(ArrayPool):
+    def __init__(
+        self,
+        game: Game,
+        p_types,
+        sway=None,
+        capacity=256,
+        max_count=None,
+        drop=DROP_OLDEST,
+    ):
+        """
+        All particles in flat arrays (structure of arrays), updated all at once
+        :param p_types: particle types, the animation is game.assets["particle/" + type]
+        :param sway: {type: (frequency, amplitude)} left/right movement by frame
+        """
+        super().__init__(capacity, max_count, drop)
         self.game = game
-        self.type = p_type
-        self.pos = list(pos)
-        self.velocity = velocity
-        self.animation = self.game.assets["particle/" + p_type].copy()
-        self.animation.frame = frame
+        self.types = list(p_types)
+        sway = sway or {}
+
+        # the frames of all types in one list, type_first[t] is the first of type t
+        self.images: list[pygame.Surface] = []
+        type_first = []
+        durations = []
+        last_frames = []
+        sways = []
+        for p_type in self.types:
+            animation = self.game.assets["particle/" + p_type]
+            type_first.append(len(self.images))
+            self.images.extend(animation.images)
+            durations.append(animation.img_duration)
+            last_frames.append(animation.img_duration * len(animation.images) - 1)
+            sways.append(sway.get(p_type, (0.0, 0.0)))
+        self.type_first = np.array(type_first)
+        self.durations = np.array(durations)
+        # particles die one update after reaching the last frame
+        self.last_frames = np.array(last_frames)
+        self.sways = np.array(sways, dtype=float)
+        self.sizes = np.array([img.get_size() for img in self.images], dtype=float)
+        # blit position is centered on the particle
+        self.half_sizes = np.array(
+            [(img.get_width() // 2, img.get_height() // 2) for img in self.images],
+            dtype=float,
+        )
+
+        self.field("pos", (2,))
+        self.field("velocity", (2,))
+        self.field("frame", dtype=np.int64)
+        self.field("type", dtype=np.int64)
+        self.field("done", dtype=bool)
+        # index of the emitter that spawned the particle, -1 for none
+        self.field("owner", dtype=np.int64)
+
+    def add(self, p_type, pos, velocity=(0, 0), frame=0, owner=-1):
+        i = self.alloc()
+        if i < 0:
+            return
+        self.pos[i] = pos
+        self.velocity[i] = velocity
+        self.frame[i] = frame
+        self.type[i] = self.types.index(p_type)
+        self.done[i] = False
+        self.owner[i] = owner
 
     def update(self):
-        kill = False
-        if self.animation.done:
-            kill = True
+        n = self.count
+        if not n:
+            return
+        pos = self.pos[:n]
+        frame = self.frame[:n]
+        p_type = self.type[:n]
 
-        self.pos[0] += self.velocity[0]
-        self.pos[1] += self.velocity[1]
+        # move left/right, e.g. leaves fall with a little sway
+        sway = self.sways[p_type]
+        pos[:, 0] += np.sin(frame * sway[:, 0]) * sway[:, 1]
+        # particles that finished the animation on the last update die now
+        alive = ~self.done[:n]
 
-        self.animation.update()
+        pos += self.velocity[:n]
+        last_frames = self.last_frames[p_type]
+        np.minimum(frame + 1, last_frames, out=frame)
+        self.done[:n] = frame >= last_frames
 
-        return kill
+        self.compact(alive)
 
     def render(self, surf: pygame.Surface, offset=(0, 0)):
-        img = self.animation.img()
-        surf.blit(
-            img,
-            (
-                self.pos[0] - offset[0] - img.get_width() // 2,
-                self.pos[1] - offset[1] - img.get_height() // 2,
-            ),
+        n = self.count
+        if not n:
+            return
+        p_type = self.type[:n]
+        image_index = self.type_first[p_type] + self.frame[:n] // self.durations[p_type]
+        blit_pos = self.pos[:n] - offset - self.half_sizes[image_index]
+        # the ones off screen are skipped
+        on_screen = np.all(
+            (blit_pos > -self.sizes[image_index]) & (blit_pos < surf.get_size()),
+            axis=1,
+        )
+        images = self.images
+        surf.blits(
+            [
+                (images[i], xy)
+                for i, xy in zip(
+                    image_index[on_screen].tolist(), blit_pos[on_screen].tolist()
+                )
+            ],
+            doreturn=False,
         )
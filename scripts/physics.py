@@ -0,0 +1,193 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+import numpy as np
+
+from scripts.entities import PhysicsEntity
+
+if TYPE_CHECKING:
+    from scripts.tilemap import Tilemap
+
+# numpy has a cost per call, below this many entities moving them one by one
+# is faster
+BATCH_MIN = 160
+# pads the rects around a tile to the same count, it never collides
+NO_RECT = (-(2**40), -(2**40), 0, 0)
+
+
+class BatchPhysics:
+    def __init__(self):
+        """
+        Moves many entities at once with the same rules as PhysicsEntity.update:
+        X first then Y, each axis resolved against the tilemap rects around the
+        entity in the same order, positions truncated to ints like pygame.Rect
+        """
+        # tile location -> (rects tuple from the tilemap, (width, 4) array of them)
+        self.rect_arrays: dict[tuple[int, int], tuple[tuple, np.ndarray]] = {}
+        # rects per tile in the arrays, grows when a tile has more
+        self.width = 1
+
+    def rects_around(self, tilemap: Tilemap, x, y):
+        """
+        Collision rects around each position as one padded array
+        :return: (n, width, 4) rects (x, y, w, h), padded with NO_RECT
+        """
+        tile_x = np.floor_divide(x, tilemap.tile_size).astype(np.int64)
+        tile_y = np.floor_divide(y, tilemap.tile_size).astype(np.int64)
+        # entities are usually close to each other, look up each tile once
+        _, first, inverse = np.unique(
+            (tile_x << 32) + (tile_y & 0xFFFFFFFF),
+            return_index=True,
+            return_inverse=True,
+        )
+        arrays = []
+        for loc in zip(tile_x[first].tolist(), tile_y[first].tolist()):
+            rects = tilemap.physics_rects_around_tile(loc)
+            cached = self.rect_arrays.get(loc)
+            if cached is None or cached[0] is not rects:
+                if len(rects) > self.width:
+                    # the cached arrays are too narrow now
+                    self.width = len(rects)
+                    self.rect_arrays.clear()
+                cached = self.rect_arrays[loc] = (
+                    rects,
+                    np.array(
+                        [tuple(rect) for rect in rects]
+                        + [NO_RECT] * (self.width - len(rects)),
+                        dtype=np.int64,
+                    ),
+                )
+            arrays.append(cached[1])
+        if any(len(array) != self.width for array in arrays):
+            # made before the width grew
+            return self.rects_around(tilemap, x, y)
+        return np.stack(arrays)[inverse]
+
+    def update(self, entities: list[PhysicsEntity], tilemap: Tilemap, movements):
+        """
+        Same as entity.update(tilemap, movement) for each entity and movement
+        """
+        if len(entities) < BATCH_MIN:
+            for entity, movement in zip(entities, movements):
+                PhysicsEntity.update(entity, tilemap, movement)
+            return
+
+        # one row per entity: x, y, velocity x, velocity y, width, height
+        state = np.array(
+            [entity.pos + entity.velocity + entity.size for entity in entities],
+            dtype=float,
+        )
+        size = state[:, 4:].astype(np.int64)
+        frame_movement = np.array(movements, dtype=float) + state[:, 2:4]
+
+        # collision on X axis
+        x = state[:, 0] + frame_movement[:, 0]
+        x, right, left = self.resolve(
+            tilemap, x, state[:, 1], size, frame_movement[:, 0], 0
+        )
+        # collision on Y axis
+        y = state[:, 1] + frame_movement[:, 1]
+        y, down, up = self.resolve(tilemap, x, y, size, frame_movement[:, 1], 1)
+
+        velocity_y = np.minimum(5.0, state[:, 3] + 0.1)
+        velocity_y[down | up] = 0
+
+        for (
+            entity,
+            movement,
+            pos_x,
+            pos_y,
+            vel_y,
+            hit_up,
+            hit_down,
+            hit_right,
+            hit_left,
+        ) in zip(
+            entities,
+            movements,
+            x.tolist(),
+            y.tolist(),
+            velocity_y.tolist(),
+            up.tolist(),
+            down.tolist(),
+            right.tolist(),
+            left.tolist(),
+        ):
+            entity.pos[0] = pos_x
+            entity.pos[1] = pos_y
+            entity.velocity[1] = vel_y
+            entity.collisions = {
+                "up": hit_up,
+                "down": hit_down,
+                "right": hit_right,
+                "left": hit_left,
+            }
+            entity.update_animation(movement)
+
+    def resolve(self, tilemap: Tilemap, x, y, size, moved, axis):
+        """
+        Pushes the entities out of the rects they overlap on one axis
+        :param moved: movement on this axis, the side pushed out depends on its sign
+        :return: new positions on the axis, hit on the positive and negative side
+        """
+        rects = self.rects_around(tilemap, x, y)
+        # pygame.Rect truncates toward zero
+        entity_x = np.trunc(x).astype(np.int64)
+        entity_y = np.trunc(y).astype(np.int64)
+        if axis == 0:
+            start, other = entity_x, entity_y
+            length, other_length = size[:, 0], size[:, 1]
+        else:
+            start, other = entity_y, entity_x
+            length, other_length = size[:, 1], size[:, 0]
+        rect_start = rects[:, :, axis]
+        rect_end = rect_start + rects[:, :, 2 + axis]
+        other_start = rects[:, :, 1 - axis]
+        other_end = other_start + rects[:, :, 3 - axis]
+        # same test as Rect.colliderect, for every rect at once
+        # the entity only moves on this axis, the other one is tested once
+        overlap = (other[:, None] < other_end) & (
+            other[:, None] + other_length[:, None] > other_start
+        )
+        hits = (
+            overlap
+            & (start[:, None] < rect_end)
+            & (start[:, None] + length[:, None] > rect_start)
+        )
+        if not hits.any():
+            no_hit = np.zeros(len(x), dtype=bool)
+            return x if axis == 0 else y, no_hit, no_hit
+
+        forward = moved > 0
+        backward = moved < 0
+        hit_any = np.zeros(len(x), dtype=bool)
+        positive = np.zeros(len(x), dtype=bool)
+        negative = np.zeros(len(x), dtype=bool)
+        columns = np.arange(rects.shape[1])
+        # last rect each entity was pushed out of, the next hit comes after it
+        last = np.full(len(x), -1)
+        while True:
+            hits &= columns > last[:, None]
+            rows = np.flatnonzero(hits.any(axis=1))
+            if not len(rows):
+                break
+            k = hits[rows].argmax(axis=1)
+            push = forward[rows]
+            pull = backward[rows]
+            start[rows] = np.where(
+                push,
+                rect_start[rows, k] - length[rows],
+                np.where(pull, rect_end[rows, k], start[rows]),
+            )
+            positive[rows] |= push
+            negative[rows] |= pull
+            hit_any[rows] = True
+            last[rows] = k
+            # the entity rect moves as it is pushed, test the pushed ones again
+            hits[rows] = (
+                overlap[rows]
+                & (start[rows, None] < rect_end[rows])
+                & (start[rows, None] + length[rows, None] > rect_start[rows])
+            )
+
+        new = x if axis == 0 else y
+        return np.where(hit_any, start, new), positive, negative
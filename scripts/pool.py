@@ -0,0 +1,83 @@
+import numpy as np
+
+# what to do when a pool is at max_count and something new is added
+DROP_OLDEST = "oldest"
+DROP_NEWEST = "newest"
+
+
+class ArrayPool:
+    def __init__(self, capacity, max_count=None, drop=DROP_OLDEST):
+        """
+        Base for effects stored as flat arrays (one array per field).
+        The arrays are allocated once and reused, dead entries are compacted out
+        :param capacity: initial size of the arrays, they grow when full
+        :param max_count: cap on living entries, None for no cap
+        :param drop: DROP_OLDEST drops the oldest entries, DROP_NEWEST ignores the new one
+        """
+        if drop not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError("unknown drop policy " + repr(drop))
+        self.capacity = capacity
+        if max_count is not None:
+            self.capacity = min(capacity, max_count)
+        self.max_count = max_count
+        self.drop = drop
+        # oldest entries dropped at once at the cap, so the arrays are shifted
+        # once per batch instead of for every new entry
+        self.drop_batch = 1 if max_count is None else max(1, max_count // 16)
+        self.count = 0
+        # entries lost to the cap, for tuning max_count
+        self.dropped = 0
+        self.fields: list[str] = []
+
+    def field(self, name, shape=(), dtype=float):
+        setattr(self, name, np.zeros((self.capacity,) + shape, dtype=dtype))
+        self.fields.append(name)
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+
+    def grow(self):
+        self.capacity *= 2
+        if self.max_count is not None:
+            self.capacity = min(self.capacity, self.max_count)
+        for name in self.fields:
+            array = getattr(self, name)
+            setattr(self, name, np.resize(array, (self.capacity,) + array.shape[1:]))
+
+    def alloc(self):
+        """
+        Reserves the slot of a new entry
+        :return: index of the slot, or -1 if the entry was dropped
+        """
+        if self.max_count is not None and self.count >= self.max_count:
+            if self.drop == DROP_NEWEST:
+                self.dropped += 1
+                return -1
+            # shift down to keep the entries ordered from oldest to newest
+            n = self.count
+            k = min(self.drop_batch, n)
+            for name in self.fields:
+                array = getattr(self, name)
+                array[: n - k] = array[k:n]
+            self.count -= k
+            self.dropped += k
+        if self.count == self.capacity:
+            self.grow()
+        self.count += 1
+        return self.count - 1
+
+    def compact(self, alive):
+        """
+        Removes the dead entries in one pass, keeping the order of the living ones
+        :param alive: bool array, one per entry
+        """
+        if alive.all():
+            return
+        keep = np.flatnonzero(alive)
+        self.count = len(keep)
+        for name in self.fields:
+            array = getattr(self, name)
+            array[: self.count] = array[keep]
@@ -0,0 +1,137 @@
+import pygame
+
+BACKENDS = ("scale", "scale2x", "sdl2")
+
+
+class Presenter:
+    def __init__(
+        self, source_size, window_size, title="", backend="scale", integer=False
+    ):
+        """
+        Opens the window and shows the low resolution display scaled up to fit it,
+        with black bars when the aspect ratio doesn't match.
+        Nothing is allocated per frame, the scaled image goes to a surface made once
+        :param backend: "scale", "scale2x" (smooths pixel art edges) or
+            "sdl2" (software SDL renderer, the window has no display surface)
+        :param integer: only scale by whole numbers, keeps the pixels square
+        """
+        if backend not in BACKENDS:
+            raise ValueError("unknown scaling backend " + repr(backend))
+        self.source_size = tuple(source_size)
+        self.backend = backend
+        self.integer = integer
+
+        self.screen: pygame.Surface | None = None
+        if backend == "sdl2":
+            from pygame._sdl2 import video
+
+            # Surface.convert needs a display mode, this one is never shown
+            pygame.display.set_mode((1, 1), pygame.HIDDEN)
+            self.window = video.Window(title, window_size, resizable=True)
+            self.renderer = video.Renderer(self.window, accelerated=0)
+            self.renderer.draw_color = (0, 0, 0, 255)
+            self.texture = video.Texture(
+                self.renderer, self.source_size, streaming=True
+            )
+        else:
+            pygame.display.set_caption(title)
+            self.screen = pygame.display.set_mode(window_size, pygame.RESIZABLE)
+        self.resize(window_size)
+
+    def resize(self, window_size):
+        if self.screen is not None:
+            # the display surface follows the window, trust its size
+            self.screen = pygame.display.get_surface()
+            window_size = self.screen.get_size()
+        width, height = window_size
+        scale = min(width / self.source_size[0], height / self.source_size[1])
+        if self.integer and scale >= 1:
+            scale = int(scale)
+        self.rect = pygame.Rect(
+            0, 0, int(self.source_size[0] * scale), int(self.source_size[1] * scale)
+        )
+        self.rect.center = width // 2, height // 2
+        window_rect = pygame.Rect(0, 0, width, height)
+        self.bars = [
+            bar
+            for bar in (
+                pygame.Rect(0, 0, width, self.rect.top),
+                pygame.Rect(0, self.rect.bottom, width, height - self.rect.bottom),
+                pygame.Rect(0, 0, self.rect.left, height),
+                pygame.Rect(self.rect.right, 0, width - self.rect.right, height),
+            )
+            if bar.width > 0 and bar.height > 0
+        ]
+        if self.screen is None:
+            return
+
+        self.screen.fill("black")
+        # scaled straight into the window when the formats match and it doesn't move
+        self.direct = self.screen.subsurface(self.rect.clip(window_rect))
+        self.target = None
+        self.doubled = None
+
+    def handle_event(self, event):
+        if event.type == pygame.WINDOWSIZECHANGED:
+            self.resize((event.x, event.y))
+
+    def window_to_source(self, pos):
+        # e.g. mouse position to display coordinates
+        return (
+            (pos[0] - self.rect.x) * self.source_size[0] / max(self.rect.width, 1),
+            (pos[1] - self.rect.y) * self.source_size[1] / max(self.rect.height, 1),
+        )
+
+    def scale(self, surf: pygame.Surface, dest: pygame.Surface):
+        if self.backend == "scale2x":
+            double = surf.get_width() * 2, surf.get_height() * 2
+            if dest.get_size() == double:
+                pygame.transform.scale2x(surf, dest)
+                return
+            if self.doubled is None:
+                self.doubled = pygame.Surface(double, 0, surf)
+            pygame.transform.scale2x(surf, self.doubled)
+            surf = self.doubled
+        pygame.transform.scale(surf, dest.get_size(), dest)
+
+    def present(self, surf: pygame.Surface, offset=(0, 0)):
+        """
+        Scales surf to the window and shows it
+        :param offset: moves the image, e.g. screen shake
+        """
+        if self.screen is None:
+            self.texture.update(surf)
+            self.renderer.clear()
+            self.texture.draw(
+                dstrect=pygame.Rect(
+                    self.rect.x + offset[0],
+                    self.rect.y + offset[1],
+                    self.rect.width,
+                    self.rect.height,
+                )
+            )
+            self.renderer.present()
+            return
+
+        # shaking can draw over the bars
+        for bar in self.bars:
+            self.screen.fill("black", bar)
+        same_format = (
+            surf.get_bitsize() == self.screen.get_bitsize()
+            and surf.get_masks() == self.screen.get_masks()
+        )
+        if (
+            not offset[0]
+            and not offset[1]
+            and same_format
+            and self.direct.get_size() == self.rect.size
+        ):
+            self.scale(surf, self.direct)
+        else:
+            if self.target is None:
+                self.target = pygame.Surface(self.rect.size, 0, surf)
+            self.scale(surf, self.target)
+            self.screen.blit(
+                self.target, (self.rect.x + offset[0], self.rect.y + offset[1])
+            )
+        pygame.display.update()
@@ -0,0 +1,89 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+import numpy as np
+import pygame
+
+from scripts.pool import ArrayPool, DROP_OLDEST
+
+if TYPE_CHECKING:
+    from scripts.spatial import SpatialHash
+    from scripts.tilemap import Tilemap
+
+
+class ProjectileSystem(ArrayPool):
+    def __init__(self, capacity=64, max_count=None, drop=DROP_OLDEST, lifetime=360):
+        """
+        All projectiles in flat arrays, moved and tested against the walls and
+        the target all at once
+        :param lifetime: frames before a projectile disappears
+        """
+        super().__init__(capacity, max_count, drop)
+        self.lifetime = lifetime
+        self.field("pos", (2,))
+        # before the last update, to draw between updates
+        self.field("last_pos", (2,))
+        self.field("velocity", (2,))
+        # frames since it was shot
+        self.field("timer")
+
+    def add(self, pos: tuple[float, float], velocity: tuple[float, float], timer=0.0):
+        i = self.alloc()
+        if i < 0:
+            return
+        self.pos[i] = pos
+        self.last_pos[i] = pos
+        self.velocity[i] = velocity
+        self.timer[i] = timer
+
+    def update(self, tilemap: Tilemap, targets: SpatialHash | None = None, group=None):
+        """
+        Moves the projectiles and removes the ones that hit a wall, expired or
+        hit a target
+        :param targets: what the projectiles can hit, None if nothing can be hit
+        :param group: only the targets in this group are hit
+        :return: (n, 2) wall hit points, (n, 2) velocities of the projectiles
+            that hit them, and the targets hit, once per projectile
+        """
+        n = self.count
+        if not n:
+            return np.zeros((0, 2)), np.zeros((0, 2)), []
+        pos = self.pos[:n]
+        self.last_pos[:n] = pos
+        pos += self.velocity[:n]
+        self.timer[:n] += 1.0
+
+        # the wall is tested along the whole move, fast projectiles can't skip it
+        wall, points = tilemap.raycast_many(self.last_pos[:n], pos)
+        removed = wall | (self.timer[:n] > self.lifetime)
+        hit = np.zeros(n, dtype=bool)
+        hit_targets = []
+        if targets is not None:
+            flying = np.flatnonzero(~removed)
+            for i, target in targets.query_points(pos[flying], group):
+                hit[flying[i]] = True
+                hit_targets.append(target)
+        wall_velocity = self.velocity[:n][wall]
+
+        self.compact(~(removed | hit))
+        return points[wall], wall_velocity, hit_targets
+
+    def render(
+        self, surf: pygame.Surface, img: pygame.Surface, offset=(0, 0), alpha=1.0
+    ):
+        """
+        Draws img centered on each projectile
+        :param alpha: draws between the last two updates, 0 before, 1 after
+        :return: the areas drawn, like blit
+        """
+        n = self.count
+        if not n:
+            return []
+        pos = self.pos[:n]
+        if alpha < 1:
+            pos = pos + (self.last_pos[:n] - pos) * (1 - alpha)
+        dest = pos - (img.get_width() / 2, img.get_height() / 2) - offset
+        # the ones off screen are skipped
+        on_screen = np.all(
+            (dest > -np.array(img.get_size())) & (dest < surf.get_size()), axis=1
+        )
+        return surf.blits([(img, pos) for pos in dest[on_screen].tolist()])
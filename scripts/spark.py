@@ -1,51 +1,57 @@
 import math
+import numpy as np
 import pygame
 
+from scripts.pool import ArrayPool, DROP_OLDEST
 
-class Spark:
-    def __init__(self, pos: tuple[float, float], angle, speed):
-        self.pos = list(pos)
-        self.angle = angle
-        self.speed = speed
+
+class SparkSystem(ArrayPool):
+    def __init__(self, capacity=128, max_count=None, drop=DROP_OLDEST):
+        """
+        All sparks in flat arrays, the direction of each spark is computed once
+        """
+        super().__init__(capacity, max_count, drop)
+        self.field("pos", (2,))
+        # (cos(angle), sin(angle)), the angle never changes
+        self.field("direction", (2,))
+        self.field("speed")
+
+    def add(self, pos: tuple[float, float], angle, speed):
+        i = self.alloc()
+        if i < 0:
+            return
+        self.pos[i] = pos
+        self.direction[i] = math.cos(angle), math.sin(angle)
+        self.speed[i] = speed
 
     def update(self):
-        self.pos[0] += math.cos(self.angle) * self.speed
-        self.pos[1] += math.sin(self.angle) * self.speed
+        n = self.count
+        if not n:
+            return
+        speed = self.speed[:n]
+        self.pos[:n] += self.direction[:n] * speed[:, None]
+        np.maximum(speed - 0.1, 0, out=speed)
 
-        self.speed = max(0, self.speed - 0.1)
-        # if speed = 0, signals to kill this spark
-        return not self.speed
+        # speed = 0 kills the spark
+        self.compact(speed > 0)
 
     def render(self, surf: pygame.Surface, offset=(0, 0)):
-        # diamond shape
-        render_points = [
-            (
-                self.pos[0] + math.cos(self.angle) * self.speed * 3 - offset[0],
-                self.pos[1] + math.sin(self.angle) * self.speed * 3 - offset[1],
-            ),
-            (
-                self.pos[0]
-                + math.cos(self.angle + math.pi * 0.5) * self.speed * 0.5
-                - offset[0],
-                self.pos[1]
-                + math.sin(self.angle + math.pi * 0.5) * self.speed * 0.5
-                - offset[1],
-            ),
-            (
-                self.pos[0]
-                + math.cos(self.angle + math.pi) * self.speed * 3
-                - offset[0],
-                self.pos[1]
-                + math.sin(self.angle + math.pi) * self.speed * 3
-                - offset[1],
-            ),
-            (
-                self.pos[0]
-                + math.cos(self.angle - math.pi * 0.5) * self.speed * 0.5
-                - offset[0],
-                self.pos[1]
-                + math.sin(self.angle - math.pi * 0.5) * self.speed * 0.5
-                - offset[1],
-            ),
+        """
+        :return: the areas drawn, like blit
+        """
+        n = self.count
+        if not n:
+            return []
+        center = self.pos[:n] - offset
+        speed = self.speed[:n, None]
+        # long axis along the direction, short axis perpendicular to it
+        front = self.direction[:n] * speed * 3
+        side = self.direction[:n, ::-1] * (-1, 1) * speed * 0.5
+        # diamond shape, (n, 4, 2)
+        points = np.stack(
+            (center + front, center + side, center - front, center - side), axis=1
+        )
+        polygon = pygame.draw.polygon
+        return [
+            polygon(surf, "white", render_points) for render_points in points.tolist()
         ]
-        pygame.draw.polygon(surf, "white", render_points)
@@ -0,0 +1,175 @@
+import numpy as np
+import pygame
+
+
+class SpatialHash:
+    def __init__(self, cell_size=32):
+        """
+        Uniform grid of the things that can touch each other (the broad phase).
+        Each item is in every cell its rect covers, queries only look at the cells
+        they cover. Results are in the order the items were added
+        :param cell_size: in pixels, about the size of the biggest items
+        """
+        self.cell_size = cell_size
+        # (x, y) cell -> {id(item): item}
+        self.cells: dict[tuple[int, int], dict[int, object]] = {}
+        # id(item) -> [item, rect, group, (left, top, right, bottom) cells, order]
+        self.entries: dict[int, list] = {}
+        self.serial = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, item):
+        return id(item) in self.entries
+
+    def clear(self):
+        self.cells = {}
+        self.entries = {}
+
+    def cell_range(self, rect: pygame.Rect):
+        # cells covered by rect, inclusive
+        return (
+            rect.left // self.cell_size,
+            rect.top // self.cell_size,
+            (rect.right - 1) // self.cell_size,
+            (rect.bottom - 1) // self.cell_size,
+        )
+
+    def move(self, item, rect: pygame.Rect, group=None):
+        """
+        Adds item or moves it to rect, the cells only change when it crosses
+        a cell border
+        :param group: e.g. "enemy", queries can be limited to one group
+        """
+        rect = pygame.Rect(rect)
+        cells = self.cell_range(rect)
+        entry = self.entries.get(id(item))
+        if entry is None:
+            entry = self.entries[id(item)] = [item, rect, group, None, self.serial]
+            self.serial += 1
+        else:
+            entry[1] = rect
+            entry[2] = group
+            if entry[3] == cells:
+                return
+            self.unlink(entry)
+        entry[3] = cells
+        for x in range(cells[0], cells[2] + 1):
+            for y in range(cells[1], cells[3] + 1):
+                self.cells.setdefault((x, y), {})[id(item)] = item
+
+    def remove(self, item):
+        # items that aren't in the hash are ignored
+        entry = self.entries.pop(id(item), None)
+        if entry is not None:
+            self.unlink(entry)
+
+    def unlink(self, entry):
+        left, top, right, bottom = entry[3]
+        for x in range(left, right + 1):
+            for y in range(top, bottom + 1):
+                cell = self.cells[(x, y)]
+                del cell[id(entry[0])]
+                if not cell:
+                    del self.cells[(x, y)]
+
+    def candidates(self, cells, group):
+        left, top, right, bottom = cells
+        if (right - left + 1) * (bottom - top + 1) > len(self.entries):
+            # big query, looking at every item is cheaper than every cell
+            # entries are in the order they were added, like the sort below
+            return [
+                entry
+                for entry in self.entries.values()
+                if (group is None or entry[2] == group)
+                and entry[3][0] <= right
+                and entry[3][2] >= left
+                and entry[3][1] <= bottom
+                and entry[3][3] >= top
+            ]
+        found = {}
+        for x in range(left, right + 1):
+            for y in range(top, bottom + 1):
+                for key in self.cells.get((x, y), ()):
+                    entry = self.entries[key]
+                    if group is None or entry[2] == group:
+                        found[key] = entry
+        return sorted(found.values(), key=lambda entry: entry[4])
+
+    def query_rect(self, rect: pygame.Rect, group=None):
+        """
+        :return: the items whose rect collides with rect
+        """
+        rect = pygame.Rect(rect)
+        return [
+            entry[0]
+            for entry in self.candidates(self.cell_range(rect), group)
+            if entry[1].colliderect(rect)
+        ]
+
+    def query_point(self, pos, group=None):
+        """
+        :return: the items whose rect contains pos
+        """
+        # Rect.collidepoint truncates the point, the cell must match
+        x, y = int(pos[0]), int(pos[1])
+        cell = x // self.cell_size, y // self.cell_size
+        return [
+            entry[0]
+            for entry in self.candidates(cell + cell, group)
+            if entry[1].collidepoint(x, y)
+        ]
+
+    def query_points(self, points, group=None):
+        """
+        query_point for an (n, 2) array of points, the first item only
+        :return: [(index of the point, item)] for the points inside an item
+        """
+        if not len(points) or not self.entries:
+            return []
+        points = np.trunc(points).astype(np.int64)
+        cell_x = points[:, 0] // self.cell_size
+        cell_y = points[:, 1] // self.cell_size
+        # only the occupied cells that have points are tested
+        _, first, inverse = np.unique(
+            (cell_x << 32) + (cell_y & 0xFFFFFFFF),
+            return_index=True,
+            return_inverse=True,
+        )
+        found = {}
+        for i, cell in enumerate(zip(cell_x[first].tolist(), cell_y[first].tolist())):
+            if cell not in self.cells:
+                continue
+            rows = np.flatnonzero(inverse == i)
+            x, y = points[rows, 0], points[rows, 1]
+            for entry in self.candidates(cell + cell, group):
+                rect = entry[1]
+                inside = (
+                    (x >= rect.left)
+                    & (x < rect.right)
+                    & (y >= rect.top)
+                    & (y < rect.bottom)
+                )
+                for index in rows[inside].tolist():
+                    found.setdefault(index, entry[0])
+        return sorted(found.items(), key=lambda hit: hit[0])
+
+    def pairs(self, group=None):
+        """
+        :return: [(a, b)] every pair of items whose rects collide, once,
+            a added before b
+        """
+        found = {}
+        for cell in self.cells.values():
+            entries = [
+                self.entries[key]
+                for key in cell
+                if group is None or self.entries[key][2] == group
+            ]
+            entries.sort(key=lambda entry: entry[4])
+            for i, a in enumerate(entries):
+                for b in entries[i + 1 :]:
+                    if (a[4], b[4]) not in found and a[1].colliderect(b[1]):
+                        found[(a[4], b[4])] = (a[0], b[0])
+        return [found[key] for key in sorted(found)]
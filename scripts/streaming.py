@@ -0,0 +1,227 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from concurrent.futures import ThreadPoolExecutor, Future
+from array import array
+import json
+import os
+
+from scripts import mapformat
+from scripts.tilemap import CHUNK_SIZE, EMPTY
+
+if TYPE_CHECKING:
+    from scripts.tilemap import Tilemap
+
+MANIFEST = "world.json"
+# tiles kept in the manifest so the game can find them without loading chunks
+OBJECT_IDS = [("spawners", 0), ("spawners", 1), ("large_decor", 2)]
+# never drawn by the game, they only live in the manifest
+OBJECT_ONLY_TYPES = {"spawners"}
+
+
+def chunk_file(folder, key):
+    return os.path.join(folder, str(key[0]) + "_" + str(key[1]) + mapformat.EXTENSION)
+
+
+def split_world(tilemap: Tilemap, folder):
+    """
+    Writes the map as a streamed world, one binary file per chunk
+    plus a manifest with the list of chunks and the objects (spawners, trees)
+    """
+    os.makedirs(folder, exist_ok=True)
+    chunk_px = CHUNK_SIZE * tilemap.tile_size
+
+    names = list(tilemap.tile_types)
+    offgrid = {}
+    for tile in tilemap.offgrid_tiles:
+        if tile["type"] in OBJECT_ONLY_TYPES:
+            continue
+        if tile["type"] not in names:
+            names.append(tile["type"])
+        # an offgrid tile belongs to the chunk of its top left corner
+        key = int(tile["pos"][0] // chunk_px), int(tile["pos"][1] // chunk_px)
+        offgrid.setdefault(key, []).append(
+            (tile["pos"][0], tile["pos"][1], names.index(tile["type"]), tile["variant"])
+        )
+
+    objects = tilemap.extract(OBJECT_IDS, keep=True)
+    hidden = {tilemap.type_ids[t] for t in OBJECT_ONLY_TYPES if t in tilemap.type_ids}
+    keys = set(tilemap.chunks) | set(offgrid)
+    for key in keys:
+        map_data = mapformat.MapData(tilemap.tile_size, CHUNK_SIZE, names)
+        if key in tilemap.chunks:
+            chunk = tilemap.chunks[key]
+            types = chunk.types
+            if hidden:
+                types = array("h", (EMPTY if t in hidden else t for t in types))
+            map_data.chunks.append((key[0], key[1], types, chunk.variants))
+        map_data.offgrid = offgrid.get(key, [])
+        mapformat.write_map(chunk_file(folder, key), map_data)
+
+    with open(os.path.join(folder, MANIFEST), "w") as f:
+        json.dump(
+            {
+                "tile_size": tilemap.tile_size,
+                "chunk_size": CHUNK_SIZE,
+                "chunks": sorted(keys),
+                "objects": objects,
+            },
+            f,
+        )
+
+
+class ChunkStreamer:
+    def __init__(self, tilemap: Tilemap, folder, radius=1, max_chunks=64, prefetch=1):
+        """
+        Keeps only the chunks of a streamed world near the camera in the tilemap
+        :param radius: chunks to keep loaded around the view
+        :param max_chunks: memory budget, the farthest chunks are dropped first
+        :param prefetch: chunks read in background ahead of the camera movement
+        """
+        self.tilemap = tilemap
+        self.folder = folder
+        self.radius = radius
+        self.max_chunks = max_chunks
+        self.prefetch = prefetch
+
+        with open(os.path.join(folder, MANIFEST), "r") as f:
+            manifest = json.load(f)
+        if manifest["chunk_size"] != CHUNK_SIZE:
+            raise ValueError("world was split with a different chunk size")
+        self.available = {tuple(key) for key in manifest["chunks"]}
+        self.objects = manifest["objects"]
+
+        self.tilemap.clear()
+        self.tilemap.tile_size = manifest["tile_size"]
+        self.chunk_px = CHUNK_SIZE * self.tilemap.tile_size
+
+        # offgrid tiles added by each loaded chunk, to remove them on eviction
+        self.loaded: dict[tuple[int, int], list[dict]] = {}
+        self.pending: dict[tuple[int, int], Future] = {}
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.last_scroll = None
+        self.last_range = None
+
+    def extract(self, id_pairs, keep=True):
+        # same as Tilemap.extract, objects are never stored in the chunks
+        return [
+            dict(tile, pos=list(tile["pos"]))
+            for tile in self.objects
+            if (tile["type"], tile["variant"]) in id_pairs
+        ]
+
+    def chunk_range(self, scroll, size, margin):
+        return (
+            int(scroll[0] // self.chunk_px) - margin,
+            int(scroll[1] // self.chunk_px) - margin,
+            int((scroll[0] + size[0]) // self.chunk_px) + margin,
+            int((scroll[1] + size[1]) // self.chunk_px) + margin,
+        )
+
+    def is_loaded(self, pos):
+        key = int(pos[0] // self.chunk_px), int(pos[1] // self.chunk_px)
+        return key in self.loaded or key not in self.available
+
+    def update(self, scroll, size, anchors=()):
+        """
+        Loads the chunks around the view and the anchors (e.g. the player)
+        and evicts the ones that went out of range
+        """
+        for key, future in list(self.pending.items()):
+            if future.done():
+                del self.pending[key]
+                if key not in self.loaded:
+                    self.apply(key, future.result())
+
+        anchor_keys = {
+            (int(pos[0] // self.chunk_px), int(pos[1] // self.chunk_px))
+            for pos in anchors
+        } & self.available
+        view_range = self.chunk_range(scroll, size, self.radius)
+        if (
+            view_range == self.last_range
+            and anchor_keys.issubset(self.loaded)
+            and len(self.loaded) <= self.max_chunks
+        ):
+            self.prefetch_ahead(scroll, size)
+            return
+        self.last_range = view_range
+
+        wanted = {
+            (cx, cy)
+            for cx in range(view_range[0], view_range[2] + 1)
+            for cy in range(view_range[1], view_range[3] + 1)
+        }
+        wanted &= self.available
+        wanted |= anchor_keys
+
+        center_x = (view_range[0] + view_range[2]) / 2
+        center_y = (view_range[1] + view_range[3]) / 2
+
+        def distance(key):
+            return abs(key[0] - center_x) + abs(key[1] - center_y)
+
+        if len(wanted) > self.max_chunks:
+            wanted = anchor_keys | set(
+                sorted(wanted, key=distance)[: self.max_chunks - len(anchor_keys)]
+            )
+
+        for key in wanted:
+            if key not in self.loaded:
+                future = self.pending.pop(key, None)
+                if future is not None:
+                    self.apply(key, future.result())
+                else:
+                    self.apply(key, mapformat.read_map(chunk_file(self.folder, key)))
+
+        # keep one extra ring so going back and forth on a border doesn't reload
+        keep_range = self.chunk_range(scroll, size, self.radius + 1)
+        for key in list(self.loaded):
+            if key in wanted:
+                continue
+            outside = not (
+                keep_range[0] <= key[0] <= keep_range[2]
+                and keep_range[1] <= key[1] <= keep_range[3]
+            )
+            if outside or len(self.loaded) > self.max_chunks:
+                self.evict(key)
+
+        self.prefetch_ahead(scroll, size)
+
+    def prefetch_ahead(self, scroll, size):
+        last_scroll = self.last_scroll
+        self.last_scroll = scroll[0], scroll[1]
+        if last_scroll is None or not self.prefetch:
+            return
+        direction = scroll[0] - last_scroll[0], scroll[1] - last_scroll[1]
+        if not direction[0] and not direction[1]:
+            return
+        # the view moved forward by prefetch chunks in the direction of the camera
+        shift = self.prefetch * self.chunk_px
+        ahead = (
+            scroll[0] + (shift if direction[0] > 0 else -shift if direction[0] else 0),
+            scroll[1] + (shift if direction[1] > 0 else -shift if direction[1] else 0),
+        )
+        ahead_range = self.chunk_range(ahead, size, self.radius)
+        for cx in range(ahead_range[0], ahead_range[2] + 1):
+            for cy in range(ahead_range[1], ahead_range[3] + 1):
+                key = (cx, cy)
+                if (
+                    key in self.available
+                    and key not in self.loaded
+                    and key not in self.pending
+                    and len(self.loaded) + len(self.pending) < self.max_chunks
+                ):
+                    self.pending[key] = self.executor.submit(
+                        mapformat.read_map, chunk_file(self.folder, key)
+                    )
+
+    def apply(self, key, map_data: mapformat.MapData):
+        # only the main thread touches the tilemap
+        self.loaded[key] = self.tilemap.add_map_data(map_data)
+
+    def evict(self, key):
+        self.tilemap.remove_chunk(key)
+        self.tilemap.remove_offgrid_tiles(self.loaded.pop(key))
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -1,7 +1,12 @@
 from __future__ import annotations
 from typing import TYPE_CHECKING
+from array import array
+import numpy as np
 import pygame
 import json
+import math
+
+from scripts import mapformat
 
 if TYPE_CHECKING:
     from game import Game
@@ -35,142 +40,927 @@ AUTOTILE_MAP = {
     tuple(sorted([(1, 0), (-1, 0), (0, 1), (0, -1)])): 8,
 }
 
+# AUTOTILE_MAP as a lookup table indexed by a 4 bit neighbor mask
+# bit i is set when the neighbor at AUTOTILE_SHIFTS[i] has the same type
+# None when there is no variant for that combination
+AUTOTILE_SHIFTS = [(1, 0), (-1, 0), (0, -1), (0, 1)]
+AUTOTILE_MASKS = [None] * (1 << len(AUTOTILE_SHIFTS))
+for neighbors, variant in AUTOTILE_MAP.items():
+    AUTOTILE_MASKS[sum(1 << AUTOTILE_SHIFTS.index(n) for n in neighbors)] = variant
+
+# the grid is split in square chunks of CHUNK_SIZE x CHUNK_SIZE tiles
+# CHUNK_SIZE must be a power of 2 so we can use shifts and masks
+CHUNK_SHIFT = 4
+CHUNK_SIZE = 1 << CHUNK_SHIFT
+CHUNK_MASK = CHUNK_SIZE - 1
+EMPTY = -1
+# size in pixels of the cells used to look up offgrid tiles
+OFFGRID_BUCKET = 64
+# numpy has a cost per call, fewer segments than this are walked one by one
+RAYCAST_BATCH_MIN = 128
+
+
+class Chunk:
+    def __init__(self):
+        # one entry per cell, row major
+        # types holds the index in Tilemap.tile_types, EMPTY if there is no tile
+        self.types = array("h", [EMPTY]) * (CHUNK_SIZE * CHUNK_SIZE)
+        self.variants = array("B", bytes(CHUNK_SIZE * CHUNK_SIZE))
+        self.count = 0
+
 
 class Tilemap:
     def __init__(self, game: Game | Editor, tile_size=16):
         self.tile_size = tile_size
         self.game = game
-        self.tilemap = {}
         self.offgrid_tiles = []
 
-        # the key is str() because the way the tiles are saved
-        # we keep "pos" as tuple to handle calculations later
+        # tiles are stored in chunks keyed by (chunk_x, chunk_y)
+        # tile types are stored as integer ids, the names are in tile_types
+        self.chunks: dict[tuple[int, int], Chunk] = {}
+        self.tile_types: list[str] = []
+        self.type_ids: dict[str, int] = {}
+        # solid_ids[type_id] is True if the type is in PHYSICS_TILES
+        self.solid_ids: list[bool] = []
 
-    def render(self, surf: pygame.Surface, offset=(0, 0)):
-        for tile in self.offgrid_tiles:
+        # static tiles pre-rendered per chunk, None if the chunk has nothing to draw
+        # entries are removed when the chunk changes and baked again on next render
+        self.chunk_surfaces: dict[tuple[int, int], pygame.Surface | None] = {}
+        # opaque pixels of each baked chunk, the static part of the outline
+        self.chunk_masks: dict[tuple[int, int], pygame.mask.Mask | None] = {}
+        # grid tiles whose image is drawn past their chunk, see overhangs()
+        self.chunk_overhangs: dict[tuple[int, int], list] = {}
+
+        # collision geometry, runs of solid tiles merged into bigger rects per chunk
+        # collision_hash maps every solid cell to the merged rect covering it
+        # chunks in collision_dirty are rebuilt on the next physics query
+        self.collision_rects: dict[tuple[int, int], list[pygame.Rect]] = {}
+        self.collision_hash: dict[tuple[int, int], pygame.Rect] = {}
+        self.collision_dirty: set[tuple[int, int]] = set()
+        # physics_rects_around() results by tile location
+        self.rects_around_cache: dict[tuple[int, int], tuple[pygame.Rect, ...]] = {}
+
+        # offgrid tiles by every OFFGRID_BUCKET cell their image touches
+        # offgrid_order keeps the draw order (by id() of the tile) for the queries
+        self.offgrid_buckets: dict[tuple[int, int], list[dict]] = {}
+        self.offgrid_order: dict[int, int] = {}
+        self.offgrid_serial = 0
+
+        # locations of the tiles of each kind, for query/extract/count
+        # grid tiles by (type id, variant), offgrid tiles by ("type", variant)
+        self.tile_index: dict[tuple[int, int], set[tuple[int, int]]] = {}
+        self.offgrid_index: dict[tuple[str, int], dict[int, dict]] = {}
+
+    def type_id(self, tile_type):
+        if tile_type not in self.type_ids:
+            self.type_ids[tile_type] = len(self.tile_types)
+            self.tile_types.append(tile_type)
+            self.solid_ids.append(tile_type in PHYSICS_TILES)
+        return self.type_ids[tile_type]
+
+    def get_tile(self, x, y):
+        """
+        Returns (type, variant) of the tile at grid location x, y
+        or None if the cell is empty
+        """
+        chunk = self.chunks.get((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT))
+        if chunk is None:
+            return None
+        i = ((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)
+        type_id = chunk.types[i]
+        if type_id == EMPTY:
+            return None
+        return self.tile_types[type_id], chunk.variants[i]
+
+    def set_tile(self, x, y, tile_type, variant):
+        key = (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.chunks[key] = Chunk()
+        i = ((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)
+        type_id = self.type_id(tile_type)
+        old_id = chunk.types[i]
+        if old_id == type_id and chunk.variants[i] == variant:
+            return
+        if old_id == EMPTY:
+            chunk.count += 1
+        else:
+            self.unindex_tile(old_id, chunk.variants[i], (x, y))
+        self.index_tile(type_id, variant, (x, y))
+        if (old_id != EMPTY and self.solid_ids[old_id]) != self.solid_ids[type_id]:
+            self.collision_dirty.add(key)
+        chunk.types[i] = type_id
+        chunk.variants[i] = variant
+        self.invalidate_grid(key)
+
+    def remove_tile(self, x, y):
+        key = (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            return False
+        i = ((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)
+        if chunk.types[i] == EMPTY:
+            return False
+        if self.solid_ids[chunk.types[i]]:
+            self.collision_dirty.add(key)
+        self.unindex_tile(chunk.types[i], chunk.variants[i], (x, y))
+        chunk.types[i] = EMPTY
+        chunk.variants[i] = 0
+        chunk.count -= 1
+        self.invalidate_grid(key)
+        # drop empty chunks so they don't pile up while editing
+        if not chunk.count:
+            del self.chunks[key]
+        return True
+
+    def index_tile(self, type_id, variant, loc):
+        self.tile_index.setdefault((type_id, variant), set()).add(loc)
+
+    def unindex_tile(self, type_id, variant, loc):
+        locs = self.tile_index[(type_id, variant)]
+        locs.discard(loc)
+        if not locs:
+            del self.tile_index[(type_id, variant)]
+
+    def index_chunk(self, key, chunk: Chunk, add=True):
+        index = self.index_tile if add else self.unindex_tile
+        types, variants = chunk.types, chunk.variants
+        for i in range(CHUNK_SIZE * CHUNK_SIZE):
+            if types[i] != EMPTY:
+                index(
+                    types[i],
+                    variants[i],
+                    (
+                        (key[0] << CHUNK_SHIFT) | (i & CHUNK_MASK),
+                        (key[1] << CHUNK_SHIFT) | (i >> CHUNK_SHIFT),
+                    ),
+                )
+
+    def tiles(self):
+        """
+        Iterates over all grid tiles as (x, y, type, variant)
+        """
+        for (cx, cy), chunk in self.chunks.items():
+            types = chunk.types
+            for i in range(CHUNK_SIZE * CHUNK_SIZE):
+                if types[i] != EMPTY:
+                    yield (
+                        (cx << CHUNK_SHIFT) | (i & CHUNK_MASK),
+                        (cy << CHUNK_SHIFT) | (i >> CHUNK_SHIFT),
+                        self.tile_types[types[i]],
+                        chunk.variants[i],
+                    )
+
+    def type_id_at(self, x, y):
+        chunk = self.chunks.get((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT))
+        if chunk is None:
+            return EMPTY
+        return chunk.types[((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)]
+
+    def is_solid(self, x, y):
+        chunk = self.chunks.get((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT))
+        if chunk is None:
+            return False
+        type_id = chunk.types[((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)]
+        return type_id != EMPTY and self.solid_ids[type_id]
+
+    def add_offgrid(self, tile_type, variant, pos):
+        tile = {"type": tile_type, "variant": variant, "pos": pos}
+        self.offgrid_tiles.append(tile)
+        self.index_offgrid(tile)
+        return tile
+
+    def remove_offgrid(self, tile):
+        self.remove_offgrid_tiles([tile])
+
+    def offgrid_rect(self, tile):
+        # the game has no images for spawners, they are extracted before rendering
+        # the map converter has no game at all
+        if self.game is None or tile["type"] not in self.game.assets:
+            return pygame.Rect(tile["pos"][0], tile["pos"][1], 1, 1)
+        img: pygame.Surface = self.game.assets[tile["type"]][tile["variant"]]
+        return pygame.Rect(tile["pos"][0], tile["pos"][1], *img.get_size())
+
+    def offgrid_bucket_keys(self, rect: pygame.Rect):
+        for bx in range(
+            rect.left // OFFGRID_BUCKET, (rect.right - 1) // OFFGRID_BUCKET + 1
+        ):
+            for by in range(
+                rect.top // OFFGRID_BUCKET, (rect.bottom - 1) // OFFGRID_BUCKET + 1
+            ):
+                yield bx, by
+
+    def index_offgrid(self, tile):
+        self.offgrid_order[id(tile)] = self.offgrid_serial
+        self.offgrid_serial += 1
+        self.offgrid_index.setdefault((tile["type"], tile["variant"]), {})[
+            id(tile)
+        ] = tile
+        rect = self.offgrid_rect(tile)
+        for key in self.offgrid_bucket_keys(rect):
+            self.offgrid_buckets.setdefault(key, []).append(tile)
+        self.invalidate_rect(rect)
+
+    def unindex_offgrid(self, tile):
+        del self.offgrid_order[id(tile)]
+        kind = (tile["type"], tile["variant"])
+        del self.offgrid_index[kind][id(tile)]
+        if not self.offgrid_index[kind]:
+            del self.offgrid_index[kind]
+        rect = self.offgrid_rect(tile)
+        for key in self.offgrid_bucket_keys(rect):
+            bucket = [other for other in self.offgrid_buckets[key] if other is not tile]
+            if bucket:
+                self.offgrid_buckets[key] = bucket
+            else:
+                del self.offgrid_buckets[key]
+        self.invalidate_rect(rect)
+
+    def offgrid_in_rect(self, rect: pygame.Rect):
+        """
+        Returns the offgrid tiles whose image touches rect (in pixels),
+        in draw order
+        """
+        found = {}
+        for key in self.offgrid_bucket_keys(rect):
+            for tile in self.offgrid_buckets.get(key, ()):
+                if id(tile) not in found and rect.colliderect(self.offgrid_rect(tile)):
+                    found[id(tile)] = tile
+        return sorted(found.values(), key=lambda tile: self.offgrid_order[id(tile)])
+
+    def offgrid_at(self, pos):
+        """
+        Returns the offgrid tiles whose image contains pos (in pixels),
+        in draw order
+        """
+        key = int(pos[0] // OFFGRID_BUCKET), int(pos[1] // OFFGRID_BUCKET)
+        found = [
+            tile
+            for tile in self.offgrid_buckets.get(key, ())
+            if self.offgrid_rect(tile).collidepoint(pos)
+        ]
+        return sorted(found, key=lambda tile: self.offgrid_order[id(tile)])
+
+    def invalidate_rect(self, rect: pygame.Rect):
+        """
+        Drops the baked surfaces of every chunk touched by rect (in pixels)
+        """
+        chunk_px = CHUNK_SIZE * self.tile_size
+        for cx in range(rect.left // chunk_px, (rect.right - 1) // chunk_px + 1):
+            for cy in range(rect.top // chunk_px, (rect.bottom - 1) // chunk_px + 1):
+                self.invalidate_chunk((cx, cy))
+
+    def invalidate_chunk(self, key):
+        self.chunk_surfaces.pop(key, None)
+        self.chunk_masks.pop(key, None)
+
+    def invalidate_grid(self, key):
+        # the grid tiles of the chunk changed, big tiles can be drawn in the
+        # chunks right and below too
+        self.invalidate_chunk(key)
+        if self.chunk_overhangs.pop(key, None) is not None:
+            # they were baked with the overhangs of this chunk
+            self.invalidate_chunk((key[0] + 1, key[1]))
+            self.invalidate_chunk((key[0], key[1] + 1))
+            self.invalidate_chunk((key[0] + 1, key[1] + 1))
+
+    def overhangs(self, key):
+        """
+        Returns the grid tiles of the chunk whose image is drawn past its right
+        or bottom border, as (x, y, image). Images are smaller than a chunk
+        """
+        found = self.chunk_overhangs.get(key)
+        if found is None:
+            found = []
+            chunk = self.chunks.get(key)
+            if chunk is not None:
+                chunk_px = CHUNK_SIZE * self.tile_size
+                types, variants = chunk.types, chunk.variants
+                for i in range(CHUNK_SIZE * CHUNK_SIZE):
+                    if types[i] == EMPTY:
+                        continue
+                    img = self.game.assets[self.tile_types[types[i]]][variants[i]]
+                    col, row = i & CHUNK_MASK, i >> CHUNK_SHIFT
+                    if (
+                        col * self.tile_size + img.get_width() > chunk_px
+                        or row * self.tile_size + img.get_height() > chunk_px
+                    ):
+                        found.append(
+                            (
+                                (key[0] << CHUNK_SHIFT) | col,
+                                (key[1] << CHUNK_SHIFT) | row,
+                                img,
+                            )
+                        )
+            self.chunk_overhangs[key] = found
+        return found
+
+    def bake_chunk(self, key):
+        chunk_px = CHUNK_SIZE * self.tile_size
+        origin = key[0] * chunk_px, key[1] * chunk_px
+        chunk_rect = pygame.Rect(origin, (chunk_px, chunk_px))
+        surf = pygame.Surface((chunk_px, chunk_px), pygame.SRCALPHA)
+        empty = True
+
+        # offgrid tiles go below grid tiles
+        # decor crossing chunk borders is drawn clipped in every chunk it touches
+        # positions are truncated first, like offgrid_rect, so the parts line up
+        for tile in self.offgrid_in_rect(chunk_rect):
             surf.blit(
                 self.game.assets[tile["type"]][tile["variant"]],
-                (tile["pos"][0] - offset[0], tile["pos"][1] - offset[1]),
+                (int(tile["pos"][0]) - origin[0], int(tile["pos"][1]) - origin[1]),
             )
+            empty = False
 
-        # only draw tiles that are on the screen
-        for x in range(
-            offset[0] // self.tile_size,
-            (offset[0] + surf.get_width()) // self.tile_size + 1,
-        ):
-            for y in range(
-                offset[1] // self.tile_size,
-                (offset[1] + surf.get_height()) // self.tile_size + 1,
+        # grid tiles row by row, with the big tiles of the chunks left and
+        # above that reach into this one
+        tiles = []
+        for neighbor in ((-1, -1), (0, -1), (-1, 0)):
+            for x, y, img in self.overhangs(
+                (key[0] + neighbor[0], key[1] + neighbor[1])
             ):
-                loc = str(x) + ";" + str(y)
-                if loc in self.tilemap:
-                    tile = self.tilemap[loc]
-                    surf.blit(
-                        self.game.assets[tile["type"]][tile["variant"]],
+                if chunk_rect.colliderect(
+                    (x * self.tile_size, y * self.tile_size, *img.get_size())
+                ):
+                    tiles.append((y, x, img))
+        chunk = self.chunks.get(key)
+        if chunk is not None:
+            types, variants = chunk.types, chunk.variants
+            for i in range(CHUNK_SIZE * CHUNK_SIZE):
+                if types[i] != EMPTY:
+                    tiles.append(
                         (
-                            tile["pos"][0] * self.tile_size - offset[0],
-                            tile["pos"][1] * self.tile_size - offset[1],
+                            (key[1] << CHUNK_SHIFT) | (i >> CHUNK_SHIFT),
+                            (key[0] << CHUNK_SHIFT) | (i & CHUNK_MASK),
+                            self.game.assets[self.tile_types[types[i]]][variants[i]],
+                        )
+                    )
+        if tiles:
+            tiles.sort(key=lambda tile: tile[:2])
+            surf.blits(
+                [
+                    (
+                        img,
+                        (
+                            x * self.tile_size - origin[0],
+                            y * self.tile_size - origin[1],
                         ),
                     )
+                    for y, x, img in tiles
+                ],
+                False,
+            )
+            empty = False
+
+        self.chunk_surfaces[key] = None if empty else surf
+        self.chunk_masks[key] = None if empty else pygame.mask.from_surface(surf)
+        return self.chunk_surfaces[key]
+
+    def render(self, surf: pygame.Surface, offset=(0, 0)):
+        # only draw chunks that are on the screen
+        chunk_px = CHUNK_SIZE * self.tile_size
+        for cx in range(
+            offset[0] // chunk_px, (offset[0] + surf.get_width()) // chunk_px + 1
+        ):
+            for cy in range(
+                offset[1] // chunk_px, (offset[1] + surf.get_height()) // chunk_px + 1
+            ):
+                key = (cx, cy)
+                if key in self.chunk_surfaces:
+                    chunk_surf = self.chunk_surfaces[key]
+                else:
+                    chunk_surf = self.bake_chunk(key)
+                if chunk_surf is not None:
+                    surf.blit(
+                        chunk_surf,
+                        (cx * chunk_px - offset[0], cy * chunk_px - offset[1]),
+                    )
+
+    def render_mask(self, mask: pygame.mask.Mask, offset=(0, 0)):
+        """
+        Adds the opaque pixels of the chunks on the screen to mask,
+        same as pygame.mask.from_surface on what render draws
+        """
+        chunk_px = CHUNK_SIZE * self.tile_size
+        width, height = mask.get_size()
+        for cx in range(offset[0] // chunk_px, (offset[0] + width) // chunk_px + 1):
+            for cy in range(
+                offset[1] // chunk_px, (offset[1] + height) // chunk_px + 1
+            ):
+                key = (cx, cy)
+                if key not in self.chunk_surfaces:
+                    self.bake_chunk(key)
+                chunk_mask = self.chunk_masks[key]
+                if chunk_mask is not None:
+                    mask.draw(
+                        chunk_mask,
+                        (cx * chunk_px - offset[0], cy * chunk_px - offset[1]),
+                    )
 
     def tiles_around(self, pos):
+        """
+        Returns the tiles around pos (in pixels) as (x, y, type, variant)
+        """
         tiles = []
-        tile_loc = int(pos[0] // self.tile_size), int(pos[1] // self.tile_size)
+        tile_x, tile_y = int(pos[0] // self.tile_size), int(pos[1] // self.tile_size)
         for offset in NEIGHBOR_OFFSETS:
-            check_loc = (
-                str(tile_loc[0] + offset[0]) + ";" + str(tile_loc[1] + offset[1])
-            )
-            if check_loc in self.tilemap:
-                tiles.append(self.tilemap[check_loc])
+            x, y = tile_x + offset[0], tile_y + offset[1]
+            tile = self.get_tile(x, y)
+            if tile is not None:
+                tiles.append((x, y, tile[0], tile[1]))
         return tiles
 
-    def physics_rects_around(self, pos):
+    def build_collision(self, key):
+        # remove the old rects of this chunk from the hash
+        for rect in self.collision_rects.pop(key, []):
+            for x in range(rect.left // self.tile_size, rect.right // self.tile_size):
+                for y in range(
+                    rect.top // self.tile_size, rect.bottom // self.tile_size
+                ):
+                    del self.collision_hash[(x, y)]
+
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            return
+
+        # horizontal runs of solid cells in each row, as (start, end) columns
+        rows = []
+        for row in range(CHUNK_SIZE):
+            runs = []
+            start = None
+            for col in range(CHUNK_SIZE + 1):
+                type_id = (
+                    chunk.types[(row << CHUNK_SHIFT) | col]
+                    if col < CHUNK_SIZE
+                    else EMPTY
+                )
+                solid = type_id != EMPTY and self.solid_ids[type_id]
+                if solid and start is None:
+                    start = col
+                elif not solid and start is not None:
+                    runs.append((start, col))
+                    start = None
+            rows.append(runs)
+
+        # stack identical runs of consecutive rows in a single rect
         rects = []
-        for tile in self.tiles_around(pos):
-            if tile["type"] in PHYSICS_TILES:
-                rects.append(
-                    pygame.Rect(
-                        tile["pos"][0] * self.tile_size,
-                        tile["pos"][1] * self.tile_size,
-                        self.tile_size,
-                        self.tile_size,
-                    )
+        for row, runs in enumerate(rows):
+            for run in runs:
+                height = 1
+                while row + height < CHUNK_SIZE and run in rows[row + height]:
+                    rows[row + height].remove(run)
+                    height += 1
+                x = (key[0] << CHUNK_SHIFT) + run[0]
+                y = (key[1] << CHUNK_SHIFT) + row
+                rect = pygame.Rect(
+                    x * self.tile_size,
+                    y * self.tile_size,
+                    (run[1] - run[0]) * self.tile_size,
+                    height * self.tile_size,
+                )
+                rects.append(rect)
+                for cell_x in range(x, x + run[1] - run[0]):
+                    for cell_y in range(y, y + height):
+                        self.collision_hash[(cell_x, cell_y)] = rect
+        if rects:
+            self.collision_rects[key] = rects
+
+    def update_collision(self):
+        for key in self.collision_dirty:
+            self.build_collision(key)
+        self.collision_dirty.clear()
+        self.rects_around_cache.clear()
+
+    def physics_rects_around(self, pos):
+        """
+        Returns the collision rects near pos (in pixels).
+        The rects are shared with the tilemap and must not be modified
+        """
+        return self.physics_rects_around_tile(
+            (int(pos[0] // self.tile_size), int(pos[1] // self.tile_size))
+        )
+
+    def physics_rects_around_tile(self, tile_loc):
+        # same as physics_rects_around, for the tile at tile_loc
+        if self.collision_dirty:
+            self.update_collision()
+        rects = self.rects_around_cache.get(tile_loc)
+        if rects is None:
+            found = []
+            for offset in NEIGHBOR_OFFSETS:
+                rect = self.collision_hash.get(
+                    (tile_loc[0] + offset[0], tile_loc[1] + offset[1])
                 )
+                # merged rects cover several cells, only add them once
+                if rect is not None and rect not in found:
+                    found.append(rect)
+            # an entity inside a merged rect must be pushed out where the
+            # neighbourhood ends, like with one rect per tile, not at its far end
+            area = pygame.Rect(
+                (tile_loc[0] - 1) * self.tile_size,
+                (tile_loc[1] - 1) * self.tile_size,
+                self.tile_size * 3,
+                self.tile_size * 3,
+            )
+            rects = self.rects_around_cache[tile_loc] = tuple(
+                rect.clip(area) for rect in found
+            )
         return rects
 
     def save(self, path):
+        if path.endswith(mapformat.EXTENSION):
+            self.save_binary(path)
+            return
+        # keep the "x;y" keyed format so old maps and tools still work
+        tilemap = {}
+        for x, y, tile_type, variant in self.tiles():
+            tilemap[str(x) + ";" + str(y)] = {
+                "type": tile_type,
+                "variant": variant,
+                "pos": [x, y],
+            }
         with open(path, "w") as f:
             json.dump(
                 {
-                    "tilemap": self.tilemap,
+                    "tilemap": tilemap,
                     "tile_size": self.tile_size,
                     "offgrid": self.offgrid_tiles,
                 },
                 f,
             )
 
+    def clear(self):
+        self.chunks = {}
+        self.offgrid_tiles = []
+        self.offgrid_buckets = {}
+        self.offgrid_order = {}
+        self.tile_index = {}
+        self.offgrid_index = {}
+        self.chunk_surfaces = {}
+        self.chunk_masks = {}
+        self.chunk_overhangs = {}
+        self.collision_rects = {}
+        self.collision_hash = {}
+        self.collision_dirty = set()
+        self.rects_around_cache = {}
+
     def load(self, path):
+        if path.endswith(mapformat.EXTENSION):
+            self.load_binary(path)
+            return
         with open(path, "r") as f:
             map_data = json.load(f)
-        self.tilemap = map_data["tilemap"]
+        self.clear()
+        for tile in map_data["tilemap"].values():
+            self.set_tile(tile["pos"][0], tile["pos"][1], tile["type"], tile["variant"])
         self.tile_size = map_data["tile_size"]
         self.offgrid_tiles = map_data["offgrid"]
+        for tile in self.offgrid_tiles:
+            self.index_offgrid(tile)
+        self.chunk_surfaces = {}
+        self.chunk_masks = {}
+        # the tile size was only known after the tiles were added
+        self.chunk_overhangs = {}
+
+    def save_binary(self, path):
+        # the chunk arrays are written as they are
+        # so the type table must start with tile_types to keep the same ids
+        names = list(self.tile_types)
+        for tile in self.offgrid_tiles:
+            if tile["type"] not in names:
+                names.append(tile["type"])
+        map_data = mapformat.MapData(self.tile_size, CHUNK_SIZE, names)
+        for (cx, cy), chunk in self.chunks.items():
+            map_data.chunks.append((cx, cy, chunk.types, chunk.variants))
+        for tile in self.offgrid_tiles:
+            map_data.offgrid.append(
+                (
+                    tile["pos"][0],
+                    tile["pos"][1],
+                    names.index(tile["type"]),
+                    tile["variant"],
+                )
+            )
+        mapformat.write_map(path, map_data)
+
+    def load_binary(self, path):
+        map_data = mapformat.read_map(path)
+        self.clear()
+        self.tile_size = map_data.tile_size
+        self.add_map_data(map_data)
+
+    def add_map_data(self, map_data: mapformat.MapData):
+        """
+        Adds the chunks and offgrid tiles of map_data to the map,
+        replacing chunks that already exist
+        :return: list of the offgrid tiles added
+        """
+        # file type id -> our type id
+        remap = [self.type_id(name) for name in map_data.names]
+        same_ids = remap == list(range(len(remap)))
+
+        for cx, cy, types, variants in map_data.chunks:
+            if map_data.chunk_size != CHUNK_SIZE:
+                for i, type_id in enumerate(types):
+                    if type_id != EMPTY:
+                        self.set_tile(
+                            cx * map_data.chunk_size + i % map_data.chunk_size,
+                            cy * map_data.chunk_size + i // map_data.chunk_size,
+                            map_data.names[type_id],
+                            variants[i],
+                        )
+                continue
+            # same layout, the arrays can be used directly
+            chunk = Chunk()
+            if same_ids:
+                chunk.types = types
+            else:
+                chunk.types = array(
+                    "h", (EMPTY if t == EMPTY else remap[t] for t in types)
+                )
+            chunk.variants = variants
+            chunk.count = len(types) - types.count(EMPTY)
+            self.remove_chunk((cx, cy))
+            # the area may have been drawn while the chunk wasn't loaded
+            self.invalidate_grid((cx, cy))
+            if chunk.count:
+                self.chunks[(cx, cy)] = chunk
+                self.collision_dirty.add((cx, cy))
+                self.index_chunk((cx, cy), chunk)
+
+        added = []
+        for x, y, type_id, variant in map_data.offgrid:
+            added.append(
+                {"type": map_data.names[type_id], "variant": variant, "pos": [x, y]}
+            )
+        self.offgrid_tiles.extend(added)
+        for tile in added:
+            self.index_offgrid(tile)
+        return added
+
+    def remove_chunk(self, key):
+        chunk = self.chunks.pop(key, None)
+        if chunk is not None:
+            self.index_chunk(key, chunk, add=False)
+            self.invalidate_grid(key)
+            self.collision_dirty.add(key)
+
+    def remove_offgrid_tiles(self, tiles):
+        removed = {id(tile) for tile in tiles}
+        self.offgrid_tiles = [
+            tile for tile in self.offgrid_tiles if id(tile) not in removed
+        ]
+        for tile in tiles:
+            self.unindex_offgrid(tile)
 
     # check if a neighbor exists and choose the correct variant
     # that better fits the location
-    # called on a key press
+    def autotile_tile(self, x, y):
+        key = (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            return
+        i = ((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)
+        type_id = chunk.types[i]
+        if type_id == EMPTY or self.tile_types[type_id] not in AUTOTILE_TYPES:
+            return
+        mask = 0
+        for bit, shift in enumerate(AUTOTILE_SHIFTS):
+            if self.type_id_at(x + shift[0], y + shift[1]) == type_id:
+                mask |= 1 << bit
+        variant = AUTOTILE_MASKS[mask]
+        if variant is not None and chunk.variants[i] != variant:
+            # the type doesn't change, so the collision geometry stays the same
+            self.unindex_tile(type_id, chunk.variants[i], (x, y))
+            self.index_tile(type_id, variant, (x, y))
+            chunk.variants[i] = variant
+            self.invalidate_grid(key)
+
+    # only the tile at x, y and its neighbors can change, called after each edit
+    def autotile_around(self, x, y):
+        self.autotile_tile(x, y)
+        for shift in AUTOTILE_SHIFTS:
+            self.autotile_tile(x + shift[0], y + shift[1])
+
+    # whole map, called on a key press
     def autotile(self):
-        for loc, tile in self.tilemap.items():
-            if tile["type"] not in AUTOTILE_TYPES:
-                continue
-            neighbors = set()
-            for shift in [(1, 0), (-1, 0), (0, -1), (0, 1)]:
-                check_loc = (
-                    str(tile["pos"][0] + shift[0])
-                    + ";"
-                    + str(tile["pos"][1] + shift[1])
+        for (cx, cy), chunk in self.chunks.items():
+            for i in range(CHUNK_SIZE * CHUNK_SIZE):
+                if chunk.types[i] != EMPTY:
+                    self.autotile_tile(
+                        (cx << CHUNK_SHIFT) | (i & CHUNK_MASK),
+                        (cy << CHUNK_SHIFT) | (i >> CHUNK_SHIFT),
+                    )
+
+    def find(self, id_pairs, rect: pygame.Rect | None = None):
+        """
+        Looks up the tiles of the requested kinds in the index
+        :param id_pairs: list of ("type", "variant")
+        :param rect: only tiles whose position (in pixels) is inside rect
+        :return: offgrid tiles in draw order, grid locations sorted by row
+        """
+        offgrid = []
+        grid = []
+        for tile_type, variant in id_pairs:
+            offgrid.extend(self.offgrid_index.get((tile_type, variant), {}).values())
+            if tile_type in self.type_ids:
+                grid.extend(
+                    self.tile_index.get((self.type_ids[tile_type], variant), ())
                 )
-                if check_loc in self.tilemap:
-                    if self.tilemap[check_loc]["type"] == tile["type"]:
-                        neighbors.add(shift)
-            neighbors = tuple(sorted(neighbors))
-            if neighbors in AUTOTILE_MAP:
-                tile["variant"] = AUTOTILE_MAP[neighbors]
+        if rect is not None:
+            offgrid = [tile for tile in offgrid if rect.collidepoint(tile["pos"])]
+            grid = [
+                loc
+                for loc in grid
+                if rect.collidepoint(loc[0] * self.tile_size, loc[1] * self.tile_size)
+            ]
+        offgrid.sort(key=lambda tile: self.offgrid_order[id(tile)])
+        grid.sort(key=lambda loc: (loc[1], loc[0]))
+        return offgrid, grid
+
+    def count(self, id_pairs, rect: pygame.Rect | None = None):
+        if rect is None:
+            total = 0
+            for tile_type, variant in id_pairs:
+                total += len(self.offgrid_index.get((tile_type, variant), ()))
+                if tile_type in self.type_ids:
+                    total += len(
+                        self.tile_index.get((self.type_ids[tile_type], variant), ())
+                    )
+            return total
+        offgrid, grid = self.find(id_pairs, rect)
+        return len(offgrid) + len(grid)
 
-    def extract(self, id_pairs, keep=False):
+    def query(self, id_pairs, rect: pygame.Rect | None = None):
+        """
+        Same as extract(id_pairs, keep=True), optionally only inside rect
+        """
+        return self.extract(id_pairs, keep=True, rect=rect)
+
+    def extract(self, id_pairs, keep=False, rect: pygame.Rect | None = None):
         """
         Returns a list of tiles that matches the requested list of id_pairs.
         Queries the map in search of given ids
         :param id_pairs: list of ("type", "variant")
         :param keep: delete from map or not
+        :param rect: only tiles whose position (in pixels) is inside rect
         :return: list of tiles matched all kinds of id_pairs
         """
-        matches = []
-        for tile in self.offgrid_tiles.copy():
-            if (tile["type"], tile["variant"]) in id_pairs:
-                matches.append(tile.copy())
-                if not keep:
-                    # this is safe because we loop in a copy
-                    self.offgrid_tiles.remove(tile)
-        for loc, tile in self.tilemap.items():
-            if (tile["type"], tile["variant"]) in id_pairs:
-                matches.append(tile.copy())
-                matches[-1]["pos"] = matches[-1]["pos"].copy()
-                # convert to pixels dimension
-                # we can change this value because it is a copy
-                # if not, we would be changing the one on display at the moment
-                matches[-1]["pos"][0] *= self.tile_size
-                matches[-1]["pos"][1] *= self.tile_size
-                if not keep:
-                    del self.tilemap[loc]
+        offgrid, grid = self.find(id_pairs, rect)
+        matches = [tile.copy() for tile in offgrid]
+        for x, y in grid:
+            tile_type, variant = self.get_tile(x, y)
+            # convert to pixels dimension
+            matches.append(
+                {
+                    "type": tile_type,
+                    "variant": variant,
+                    "pos": [x * self.tile_size, y * self.tile_size],
+                }
+            )
+        if not keep:
+            self.remove_offgrid_tiles(offgrid)
+            for x, y in grid:
+                self.remove_tile(x, y)
         return matches
 
     def solid_check(self, pos):
-        tile_loc = (
-            str(int(pos[0] // self.tile_size))
-            + ";"
-            + str(int(pos[1] // self.tile_size))
+        return self.is_solid(
+            int(pos[0] // self.tile_size), int(pos[1] // self.tile_size)
         )
-        if tile_loc in self.tilemap:
-            if self.tilemap[tile_loc]["type"] in PHYSICS_TILES:
-                return self.tilemap[tile_loc]
+
+    def raycast(self, start, end):
+        """
+        Walks the grid cells crossed by the segment start -> end (in pixels)
+        in order, using a DDA traversal
+        :return: ((x, y) cell, distance, hit point) of the first solid cell,
+            None if the segment is clear
+        """
+        x, y = int(start[0] // self.tile_size), int(start[1] // self.tile_size)
+        if self.is_solid(x, y):
+            return (x, y), 0.0, (start[0], start[1])
+        dx, dy = end[0] - start[0], end[1] - start[1]
+        length = math.hypot(dx, dy)
+        if not length:
+            return None
+
+        # t is the fraction of the segment, t_max the t of the next cell border
+        # on each axis and t_delta the t needed to cross a whole cell
+        step_x = 1 if dx > 0 else -1
+        step_y = 1 if dy > 0 else -1
+        if dx:
+            t_max_x = ((x + (dx > 0)) * self.tile_size - start[0]) / dx
+            t_delta_x = self.tile_size / abs(dx)
+        else:
+            t_max_x = t_delta_x = math.inf
+        if dy:
+            t_max_y = ((y + (dy > 0)) * self.tile_size - start[1]) / dy
+            t_delta_y = self.tile_size / abs(dy)
+        else:
+            t_max_y = t_delta_y = math.inf
+
+        while True:
+            if t_max_x < t_max_y:
+                t = t_max_x
+                x += step_x
+                t_max_x += t_delta_x
+            else:
+                t = t_max_y
+                y += step_y
+                t_max_y += t_delta_y
+            if t > 1:
+                return None
+            if self.is_solid(x, y):
+                return (x, y), t * length, (start[0] + dx * t, start[1] + dy * t)
+
+    def solid_many(self, x, y):
+        """
+        is_solid for arrays of cells
+        :return: bool array, one per cell
+        """
+        x = np.asarray(x, dtype=np.int64)
+        y = np.asarray(y, dtype=np.int64)
+        solid = np.zeros(x.shape, dtype=bool)
+        if not x.size:
+            return solid
+        # EMPTY (-1) picks the False at the end
+        solid_ids = np.array(self.solid_ids + [False], dtype=bool)
+        cells = ((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)
+        chunk_x, chunk_y = x >> CHUNK_SHIFT, y >> CHUNK_SHIFT
+        # the cells are usually in a few chunks, look up each chunk once
+        _, first, inverse = np.unique(
+            (chunk_x << 32) + (chunk_y & 0xFFFFFFFF),
+            return_index=True,
+            return_inverse=True,
+        )
+        for i, key in enumerate(zip(chunk_x[first].tolist(), chunk_y[first].tolist())):
+            chunk = self.chunks.get(key)
+            if chunk is None:
+                continue
+            rows = inverse == i
+            types = np.frombuffer(chunk.types, dtype=np.int16)
+            solid[rows] = solid_ids[types[cells[rows]]]
+        return solid
+
+    def raycast_many(self, starts, ends):
+        """
+        raycast for many segments at once, the cells of each segment are walked
+        in the same order so the hit points are the same
+        :param starts: (n, 2) array in pixels
+        :param ends: (n, 2) array in pixels
+        :return: bool array of the segments that hit a solid cell,
+            (n, 2) array of the hit points (meaningless where there is no hit)
+        """
+        if len(starts) < RAYCAST_BATCH_MIN:
+            hit = np.zeros(len(starts), dtype=bool)
+            points = np.zeros((len(starts), 2))
+            for i, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+                found = self.raycast(start, end)
+                if found:
+                    hit[i] = True
+                    points[i] = found[2]
+            return hit, points
+
+        start_x, start_y = starts[:, 0], starts[:, 1]
+        x = np.floor_divide(start_x, self.tile_size).astype(np.int64)
+        y = np.floor_divide(start_y, self.tile_size).astype(np.int64)
+        dx, dy = ends[:, 0] - start_x, ends[:, 1] - start_y
+        hit = self.solid_many(x, y)
+        t = np.zeros(len(starts))
+
+        step_x = np.where(dx > 0, 1, -1)
+        step_y = np.where(dy > 0, 1, -1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t_max_x = np.where(
+                dx != 0, ((x + (dx > 0)) * self.tile_size - start_x) / dx, np.inf
+            )
+            t_delta_x = np.where(dx != 0, self.tile_size / np.abs(dx), np.inf)
+            t_max_y = np.where(
+                dy != 0, ((y + (dy > 0)) * self.tile_size - start_y) / dy, np.inf
+            )
+            t_delta_y = np.where(dy != 0, self.tile_size / np.abs(dy), np.inf)
+
+        # segments still walking
+        rows = np.flatnonzero(~hit & ((dx != 0) | (dy != 0)))
+        while len(rows):
+            next_x = t_max_x[rows] < t_max_y[rows]
+            on_x, on_y = rows[next_x], rows[~next_x]
+            t[on_x] = t_max_x[on_x]
+            x[on_x] += step_x[on_x]
+            t_max_x[on_x] += t_delta_x[on_x]
+            t[on_y] = t_max_y[on_y]
+            y[on_y] += step_y[on_y]
+            t_max_y[on_y] += t_delta_y[on_y]
+            rows = rows[t[rows] <= 1]
+            if not len(rows):
+                break
+            solid = self.solid_many(x[rows], y[rows])
+            hit[rows[solid]] = True
+            rows = rows[~solid]
+
+        t[~hit] = 0
+        points = starts + np.stack((dx, dy), axis=1) * t[:, None]
+        return hit, points
+
+    def line_of_sight(self, start, end):
+        return self.raycast(start, end) is None
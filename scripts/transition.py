@@ -0,0 +1,65 @@
+import pygame
+
+# the transition counts from 1 (almost clear) to STEPS (black)
+STEPS = 30
+
+
+class Transition:
+    def __init__(self, size, steps=STEPS):
+        """
+        Covers the screen between levels, nothing is allocated while it runs
+        :param size: size of the surface it is drawn on
+        :param steps: step that covers the whole screen
+        """
+        self.size = size
+        self.steps = steps
+
+    def render(self, surf: pygame.Surface, step):
+        """
+        :param step: how covered the screen is, 0 clear to steps black
+        """
+        pass
+
+
+class IrisTransition(Transition):
+    def __init__(self, size, steps=STEPS):
+        # black with a clear circle in the middle that closes
+        super().__init__(size, steps)
+        self.frames: list[pygame.Surface] = []
+        center = pygame.Rect((0, 0), size).center
+        for step in range(steps + 1):
+            frame = pygame.Surface(size)
+            pygame.draw.circle(frame, "white", center, (steps - step) * 8)
+            frame.set_colorkey("white")
+            self.frames.append(frame)
+
+    def render(self, surf: pygame.Surface, step):
+        surf.blit(self.frames[step], (0, 0))
+
+
+class FadeTransition(Transition):
+    def __init__(self, size, steps=STEPS):
+        super().__init__(size, steps)
+        self.frame = pygame.Surface(size)
+
+    def render(self, surf: pygame.Surface, step):
+        self.frame.set_alpha(255 * step // self.steps)
+        surf.blit(self.frame, (0, 0))
+
+
+class WipeTransition(Transition):
+    def __init__(self, size, steps=STEPS):
+        # black curtain coming from the left
+        super().__init__(size, steps)
+        self.rect = pygame.Rect((0, 0), size)
+
+    def render(self, surf: pygame.Surface, step):
+        self.rect.width = self.size[0] * step // self.steps
+        surf.fill("black", self.rect)
+
+
+TRANSITIONS = {
+    "iris": IrisTransition,
+    "fade": FadeTransition,
+    "wipe": WipeTransition,
+}
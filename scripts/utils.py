@@ -1,11 +1,39 @@
 import os
 import pygame
 
+from scripts.atlas import Atlas, MANIFEST as ATLAS_MANIFEST
+
 BASE_IMAGE_PATH = "data/images/"
+ATLAS_PATH = "data/atlas/"
+
+# after use_atlas() the images are subsurfaces of the atlas sheets
+atlas: Atlas | None = None
+
+
+def use_atlas(folder=ATLAS_PATH):
+    """
+    Loads the sheets made by build_atlas.py, load_image takes the images from them
+    :return: False if there is no atlas, images are loaded from their files
+    """
+    global atlas
+    if not os.path.exists(os.path.join(folder, ATLAS_MANIFEST)):
+        atlas = None
+        return False
+    atlas = Atlas(folder, BASE_IMAGE_PATH)
+    return True
+
+
+def convert_image(img: pygame.Surface):
+    # display format, black is transparent
+    img = img.convert()
+    img.set_colorkey((0, 0, 0))
+    return img
 
 
 def load_image(path):
-    img = pygame.image.load(BASE_IMAGE_PATH + path).convert()
+    img = atlas.get(path) if atlas is not None else None
+    if img is None:
+        return convert_image(pygame.image.load(BASE_IMAGE_PATH + path))
     img.set_colorkey((0, 0, 0))
     return img
 
@@ -17,16 +45,28 @@ def load_images(path):
     return images
 
 
+def flip_image(img: pygame.Surface):
+    # mirrored left/right, for sprites looking the other way
+    return pygame.transform.flip(img, True, False)
+
+
 class Animation:
-    def __init__(self, images: list[pygame.Surface], img_duration=5, loop=True):
+    def __init__(
+        self, images: list[pygame.Surface], img_duration=5, loop=True, flipped=None
+    ):
         self.images = images
+        # mirrored frames, built the first time they are drawn
+        # and shared with the copies, like images
+        self.flipped: list[pygame.Surface | None] = (
+            flipped if flipped is not None else [None] * len(images)
+        )
         self.img_duration = img_duration
         self.loop = loop
         self.done = False
         self.frame = 0
 
     def copy(self):
-        return Animation(self.images, self.img_duration, self.loop)
+        return Animation(self.images, self.img_duration, self.loop, self.flipped)
 
     def update(self):
         if self.loop:
@@ -36,5 +76,20 @@ class Animation:
             if self.frame >= self.img_duration * len(self.images) - 1:
                 self.done = True
 
-    def img(self):
-        return self.images[int(self.frame / self.img_duration)]
+    def img(self, flip=False):
+        index = int(self.frame / self.img_duration)
+        if not flip:
+            return self.images[index]
+        img = self.flipped[index]
+        if img is None:
+            img = self.flipped[index] = flip_image(self.images[index])
+        return img
+
+
+class NullSound:
+    # stands in for pygame.mixer.Sound when there is no audio (headless runs)
+    def play(self, *args, **kwargs):
+        pass
+
+    def set_volume(self, volume):
+        pass